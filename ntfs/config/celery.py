@@ -2,6 +2,7 @@
 
 import os
 from celery import Celery
+from celery.signals import celeryd_init
 import django
 
 # set the default Django settings module for the 'celery' program.
@@ -19,3 +20,19 @@ app.config_from_object("django.conf:settings", namespace="CELERY")
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks(["services.publishers.tasks"])
+
+
+@celeryd_init.connect
+def patch_psycopg(**kwargs):
+    """makes psycopg2 cooperative in gevent workers, without it
+    every query blocks all the greenlets of the worker"""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return
+
+    # -- celery monkey patches before loading the app with --pool gevent --
+    if monkey.is_module_patched("socket"):
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
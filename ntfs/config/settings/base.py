@@ -163,3 +163,110 @@ EMAIL_PORT = 465
 EMAIL_USE_SSL = True
 EMAIL_USE_TLS = False
 DEFAULT_FROM_EMAIL = "Aaron"
+
+# PUBLISHERS
+# max number of events accepted in a single batch publish request
+PUBLISHER_MAX_BATCH_SIZE = 1000
+# number of events validated, inserted and dispatched together
+# by the streaming ingest endpoint
+PUBLISHER_STREAM_CHUNK_SIZE = 500
+# seconds a published idempotency key keeps deduplicating retries
+PUBLISHER_IDEMPOTENCY_WINDOW = 3600 * 24
+# route events through handle_event (an extra task and event log read)
+# instead of queuing their action task directly
+PUBLISHER_TWO_HOP_DISPATCH = False
+# number of recipients a broadcast loads and publishes at a time
+PUBLISHER_BROADCAST_CHUNK_SIZE = 2000
+
+# every action gets its own queue (see services.publishers.tasks.routing)
+# and its own worker: python manage.py run_worker <queue>
+CELERY_TASK_ROUTES = ("services.publishers.tasks.routing.route_task",)
+
+# worker pool per queue, cpu bound work runs on prefork,
+# I/O bound providers on gevent or threads
+PUBLISHER_WORKER_POOLS = {
+    "events": {"pool": "prefork", "concurrency": 2},
+    "notify_user": {"pool": "threads", "concurrency": 16},
+    "send_mail": {"pool": "gevent", "concurrency": 100, "prefetch_multiplier": 4},
+    "send_sms": {"pool": "gevent", "concurrency": 100, "prefetch_multiplier": 4},
+    "broadcast": {"pool": "prefork", "concurrency": 1},
+}
+
+# buffer event status transitions in the worker and write them
+# in bulk every FLUSH_INTERVAL_MS or MAX_BATCH transitions
+EVENTLOG_WRITE_BEHIND = {
+    "ENABLED": False,
+    "FLUSH_INTERVAL_MS": 200,
+    "MAX_BATCH": 500,
+}
+
+# how tasks hand notifications to the websocket servers, "rabbitmq"
+# through the channel layer's groups exchange, or "unix" for a worker
+# and ASGI server on the same host: datagrams to a socket per ASGI
+# process in SOCKET_DIR, use the in-memory channel layer with it.
+# notifications of a task are packed in datagrams of up to MAX_DATAGRAM
+# bytes, a process whose socket stays full for SEND_TIMEOUT_MS misses them
+NOTIFICATION_DELIVERY = {
+    "BACKEND": "rabbitmq",
+    "SOCKET_DIR": "/tmp/ntfs-delivery",
+    "SEND_TIMEOUT_MS": 100,
+    "MAX_DATAGRAM": 16 * 1024,
+}
+
+# AUTH
+# resolved knox tokens are cached in-process (in the CACHE_L1 cache,
+# invalidated in every process on logout and user saves) and in the
+# default cache with REDIS, so REST requests and websocket handshakes
+# skip the database, TTL also bounds how long a token renewal
+# (AUTO_REFRESH) is skipped
+PRINCIPAL_CACHE = {
+    "ENABLED": True,
+    "TTL": 60,
+    "REDIS": False,
+}
+
+# SUBSCRIBERS
+# notifications replayed per query, and at most, when a websocket
+# client reconnects with ?since=<cursor>
+WS_REPLAY_PAGE_SIZE = 100
+WS_REPLAY_MAX_MESSAGES = 1000
+# messages to a client that connected with ?batch=1 are sent as one
+# array frame per window (in milliseconds) or every WS_BATCH_MAX messages
+WS_BATCH_WINDOW_MS = 20
+WS_BATCH_MAX = 50
+# bounded send queue per websocket connection, when a slow client lets
+# MAX_SIZE messages pile up the OVERFLOW policy applies: drop_oldest,
+# coalesce (dropped messages become a notification_summary) or disconnect,
+# the queue only fills up if the ASGI server's send waits for the client
+# (uvicorn --ws websockets, daphne buffers without limit)
+WS_SEND_QUEUE = {
+    "MAX_SIZE": 256,
+    "OVERFLOW": "coalesce",
+}
+# connected users are registered in redis (REDIS_URL, defaults to the
+# default cache) and tasks don't publish notifications to offline users,
+# connections refresh their entry every HEARTBEAT_INTERVAL seconds and
+# expire TTL seconds after their last heartbeat
+PRESENCE = {
+    "ENABLED": True,
+    "TTL": 90,
+    "HEARTBEAT_INTERVAL": 30,
+    "REDIS_URL": None,
+}
+# websocket connections of every user are registered with the device id
+# and class they connect with (?device=<id>&class=<class>), a user keeps
+# at most MAX_PER_USER connections (0 for no limit), the oldest are
+# evicted, entries expire TTL seconds after the last heartbeat
+WS_SESSIONS = {
+    "ENABLED": True,
+    "MAX_PER_USER": 5,
+    "TTL": 90,
+}
+# drain mode for deploys (manage.py drain_websockets or SIGNAL sent to
+# the ASGI process): new connections are refused, clients get a reconnect
+# hint within WINDOW seconds and are closed in waves every WAVE_INTERVAL
+WS_DRAIN = {
+    "WINDOW": 60,
+    "WAVE_INTERVAL": 1,
+    "SIGNAL": "SIGUSR1",
+}
@@ -99,7 +99,7 @@ REST_FRAMEWORK.update(
     {
         "DEFAULT_AUTHENTICATION_CLASSES": (
             "services.authservice.backends.OAuth2ClientCredentialAuthentication",
-            "knox.auth.TokenAuthentication",
+            "services.authservice.backends.CachedTokenAuthentication",
         ),
         "TEST_REQUEST_DEFAULT_FORMAT": "json",
         "DEFAULT_VERSIONING_CLASS": "rest_framework.versioning.NamespaceVersioning",
@@ -133,6 +133,9 @@ CACHES = {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
         "LOCATION": env("REDIS_URI"),
         # "OPTIONS": {"ssl_cert_reqs": None},
+        # -- fail fast when redis is unreachable,
+        # see CACHE_CIRCUIT_BREAKER --
+        "OPTIONS": {"socket_connect_timeout": 0.5, "socket_timeout": 0.5},
     },
     "fallback": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
@@ -140,6 +143,33 @@ CACHES = {
     },
 }
 
+# in-process cache in front of the default cache for read-heavy keys
+# (Cache(local=True)), entries live at most TTL seconds and are dropped
+# in every process through redis pub/sub on CHANNEL when they change
+CACHE_L1 = {
+    "ENABLED": True,
+    "MAXSIZE": 10000,
+    "TTL": 30,
+    "CHANNEL": "cache_invalidation",
+}
+
+# services.utils.Cache calls go straight to the fallback cache after
+# FAILURE_THRESHOLD redis errors in a row, redis is probed every
+# PROBE_INTERVAL seconds and used again once it answers, after the keys
+# written meanwhile (up to MAX_MISSED_KEYS) are dropped from redis
+CACHE_CIRCUIT_BREAKER = {
+    "FAILURE_THRESHOLD": 3,
+    "PROBE_INTERVAL": 5,
+    "MAX_MISSED_KEYS": 100000,
+}
+
+# codecs services.utils.Cache(codec=<name>) stores values with instead
+# of pickle, values encoded to more than THRESHOLD bytes are compressed,
+# compare them with manage.py bench_cache_codecs
+CACHE_CODECS = {
+    "compact": {"SERIALIZER": "json", "COMPRESSION": "zlib", "THRESHOLD": 1024},
+}
+
 ssl_context = ssl.SSLContext()
 ssl_context.check_hostname = False
 
@@ -28,7 +28,8 @@ schema_view = get_schema_view(
 # api url mappings
 api = [
     path("", include("services.authservice.urls", namespace="auth_service")),
-    path("", include("services.publishers.urls", namespace="publishers"))
+    path("", include("services.publishers.urls", namespace="publishers")),
+    path("", include("services.subscribers.urls", namespace="subscribers")),
 ]
 
 # oauth url mapping
@@ -0,0 +1,91 @@
+"""measures time-to-deliver of a broadcast
+
+usage:
+    python manage.py bench_broadcast --recipients 100000
+
+the recipients are created as benchmark users in a
+dedicated group (reused between runs), one broadcast event is
+dispatched to the group and the command waits for the broadcast
+worker to finish it. Run it against a dev broker with a worker
+consuming the broadcast queue.
+"""
+import time
+
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import EventLog, User
+from services.publishers.tasks.handler import dispatch_event
+
+GROUP_NAME = "broadcast-benchmark"
+FINISHED = ("SUCCESS", "FAILURE")
+
+
+class Command(BaseCommand):
+    help = "measure time-to-deliver of a broadcast to many recipients"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--recipients", type=int, default=100000)
+        parser.add_argument("--save-notification", action="store_true")
+        parser.add_argument("--timeout", type=int, default=600)
+        parser.add_argument(
+            "--cleanup", action="store_true", help="delete the benchmark users"
+        )
+
+    def handle(self, *args, **options):
+        group, _ = Group.objects.get_or_create(name=GROUP_NAME)
+        if options["cleanup"]:
+            deleted, _ = User.objects.filter(groups=group).delete()
+            group.delete()
+            self.stdout.write(f"deleted {deleted} rows")
+            return
+
+        self.create_recipients(group, options["recipients"])
+
+        sender = User.objects.exclude(groups=group).first()
+        if sender is None:
+            raise CommandError("no user found to publish the broadcast as")
+
+        body = {
+            "action": "broadcast",
+            "user": str(sender.user_id),
+            "recipients": {"groups": [GROUP_NAME]},
+            "payload": {"message": "benchmark"},
+            "notification": {"save_notification": options["save_notification"]},
+        }
+        event = EventLog.objects.create(user=sender, body=body)
+
+        start = time.perf_counter()
+        dispatch_event(str(event.id), body)
+
+        deadline = time.monotonic() + options["timeout"]
+        while not EventLog.objects.filter(id=event.id, status__in=FINISHED).exists():
+            if time.monotonic() > deadline:
+                raise CommandError("timed out waiting for the broadcast worker")
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - start
+
+        event.refresh_from_db()
+        self.stdout.write(
+            f"{event.status} in {elapsed:.2f}s "
+            f"({options['recipients'] / elapsed:.0f} recipients/s): {event.message}"
+        )
+
+    def create_recipients(self, group, total):
+        existing = User.objects.filter(groups=group).count()
+        if existing >= total:
+            return
+
+        self.stdout.write(f"creating {total - existing} benchmark users...")
+        users = User.objects.bulk_create(
+            [
+                User(email=f"broadcast-benchmark-{index}@example.com")
+                for index in range(existing, total)
+            ],
+            batch_size=5000,
+        )
+        membership = User.groups.through
+        membership.objects.bulk_create(
+            [membership(user_id=user.user_id, group_id=group.id) for user in users],
+            batch_size=5000,
+        )
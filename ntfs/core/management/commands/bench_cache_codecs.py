@@ -0,0 +1,90 @@
+"""compares the cache codecs on a UserSerializer page
+
+usage:
+    python manage.py bench_cache_codecs --page-size 100 --runs 200
+
+a page of users is serialized like UserViewset.list caches it and
+encoded with every available codec, encode and decode times are per
+value, stored bytes are what the redis cache writes (django pickles
+the encoded bytes too). Users are repeated when the database has
+fewer than --page-size of them, which flatters the compressed sizes,
+run it against a database with enough users.
+"""
+import json
+import pickle
+import statistics
+import time
+from itertools import cycle, islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import User
+from services.authservice.api.common.serializers.user import UserSerializer
+from services.utils import codecs
+
+
+def get_codecs():
+    candidates = [("pickle", None)] + [
+        (serializer, compression)
+        for serializer in codecs.SERIALIZERS
+        for compression in (None, *codecs.COMPRESSORS)
+    ]
+    for serializer, compression in candidates:
+        if serializer == "pickle":
+            yield codecs.PASSTHROUGH
+            continue
+        try:
+            yield codecs.Codec(serializer, compression=compression)
+        except Exception:
+            # -- compression library not installed --
+            continue
+
+
+def dumps(value):
+    # -- what django's redis serializer stores --
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+class Command(BaseCommand):
+    help = "compare encode/decode time and stored size of the cache codecs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--runs", type=int, default=200)
+
+    def handle(self, *args, **options):
+        users = list(User.objects.all()[: options["page_size"]])
+        if not users:
+            raise CommandError("no user found, create some users first")
+
+        rows = UserSerializer(users, many=True).data
+        page = {
+            "message": "success!",
+            "code": 200,
+            # -- copies, pickle would store repeated objects once --
+            "payload": [
+                json.loads(json.dumps(row, default=str))
+                for row in islice(cycle(rows), options["page_size"])
+            ],
+            "meta": {"next": None, "previous": None, "count": len(rows)},
+        }
+
+        for codec in get_codecs():
+            self.report(codec, page, options["runs"])
+
+    def report(self, codec, page, runs):
+        encode_times, decode_times = [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            stored = dumps(codec.encode(page))
+            encode_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            codec.decode(pickle.loads(stored))
+            decode_times.append(time.perf_counter() - start)
+
+        self.stdout.write(
+            f"{codec.name:<14} {len(stored):>9} bytes "
+            f"encode={statistics.median(encode_times) * 1e6:8.1f}us "
+            f"decode={statistics.median(decode_times) * 1e6:8.1f}us"
+        )
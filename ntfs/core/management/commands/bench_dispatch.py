@@ -0,0 +1,87 @@
+"""measures end-to-end latency of the direct and two-hop dispatch paths
+
+usage:
+    python manage.py bench_dispatch --events 500
+
+events are created and dispatched for real and the command waits for
+the workers to finish them, latency is the time between the event log
+insert and its final status update. Run it against a dev broker with
+workers consuming every queue.
+"""
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import EventLog, User
+from services.publishers.tasks.handler import dispatch_events
+
+FINISHED = ("SUCCESS", "FAILURE")
+
+
+class Command(BaseCommand):
+    help = "compare end-to-end latency of direct and two-hop event dispatch"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=500)
+        parser.add_argument("--action", type=str, default="notify_user")
+        parser.add_argument("--user", type=str, default=None)
+        parser.add_argument("--timeout", type=int, default=300)
+
+    def handle(self, *args, **options):
+        user = (
+            User.objects.filter(user_id=options["user"]).first()
+            if options["user"]
+            else User.objects.first()
+        )
+        if user is None:
+            raise CommandError("no user found, create one or pass --user")
+
+        for name, two_hop in (("direct", False), ("two-hop", True)):
+            latencies, elapsed = self.run(user, options, two_hop)
+            self.report(name, latencies, elapsed, options["events"])
+
+    def run(self, user, options, two_hop):
+        body = {
+            "action": options["action"],
+            "user": str(user.user_id),
+            "payload": {"message": "benchmark"},
+            "notification": {"save_notification": False},
+        }
+        events = EventLog.objects.bulk_create(
+            [EventLog(user=user, body=body) for _ in range(options["events"])]
+        )
+        ids = [event.id for event in events]
+
+        start = time.perf_counter()
+        dispatch_events([(str(event.id), body) for event in events], two_hop=two_hop)
+
+        deadline = time.monotonic() + options["timeout"]
+        finished = EventLog.objects.filter(id__in=ids, status__in=FINISHED)
+        while finished.count() < len(ids):
+            if time.monotonic() > deadline:
+                self.stderr.write("timed out waiting for the workers")
+                break
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - start
+
+        latencies = [
+            (updated_at - created_at).total_seconds() * 1000
+            for created_at, updated_at in finished.values_list(
+                "created_at", "updated_at"
+            )
+        ]
+        EventLog.objects.filter(id__in=ids).delete()
+        return latencies, elapsed
+
+    def report(self, name, latencies, elapsed, total):
+        if len(latencies) < 2:
+            self.stdout.write(f"{name:<8} not enough finished events")
+            return
+
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{name:<8} {len(latencies)}/{total} finished in {elapsed:.2f}s "
+            f"p50={percentiles[49]:.1f}ms p95={percentiles[94]:.1f}ms "
+            f"p99={percentiles[98]:.1f}ms max={max(latencies):.1f}ms"
+        )
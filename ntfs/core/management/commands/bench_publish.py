@@ -0,0 +1,78 @@
+"""benchmarks the sync publisher view against the native async one
+
+usage:
+    python manage.py bench_publish --requests 2000 --concurrency 50
+
+both views are called through django's ASGI test client so the numbers
+reflect how they behave under config/asgi.py, events are really created
+and published, use a dev broker and database.
+"""
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import EventLog, User
+
+
+class Command(BaseCommand):
+    help = "compare requests/sec of the sync and async publish endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=50)
+        parser.add_argument("--user", type=str, default=None)
+        parser.add_argument(
+            "--keep", action="store_true", help="don't delete the created events"
+        )
+
+    def handle(self, *args, **options):
+        user = (
+            User.objects.filter(user_id=options["user"]).first()
+            if options["user"]
+            else User.objects.first()
+        )
+        if user is None:
+            raise CommandError("no user found, create one or pass --user")
+
+        event = {
+            "action": "notify_user",
+            "user": str(user.user_id),
+            "payload": {"message": "benchmark"},
+        }
+        started_at = timezone.now()
+
+        for name in ("publishers:v1:event-publisher", "publishers:v1:async-event-publisher"):
+            url = reverse(name)
+            elapsed, failed = asyncio.run(
+                self.run(url, event, options["requests"], options["concurrency"])
+            )
+            self.stdout.write(
+                f"{url:<24} {options['requests'] / elapsed:10.1f} req/s "
+                f"{elapsed * 1000 / options['requests']:8.2f} ms/req "
+                f"{failed} failed"
+            )
+
+        if not options["keep"]:
+            EventLog.objects.filter(
+                user=user, body__payload__message="benchmark", created_at__gte=started_at
+            ).delete()
+
+    async def run(self, url, event, requests, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+        failed = 0
+
+        async def publish():
+            nonlocal failed
+            async with semaphore:
+                response = await client.post(url, event, content_type="application/json")
+                if response.status_code != 200:
+                    failed += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(publish() for _ in range(requests)))
+        return time.perf_counter() - start, failed
@@ -0,0 +1,136 @@
+"""measures websocket handshake authentication latency
+
+usage:
+    python manage.py bench_ws_auth --tokens 10000 100000 1000000
+
+for every size the token table is filled up to that many benchmark
+tokens (with their AuthTokenHash rows) and TokenAuthMiddleware
+authenticates ``?tk=<sha256>`` handshakes for random tokens. Pass
+--legacy to also time the previous full scan (only sensible for the
+smaller sizes) and --cleanup to delete the benchmark tokens.
+"""
+import asyncio
+import hashlib
+import random
+import secrets
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from knox.models import AuthToken
+
+from core.models import AuthTokenHash, User
+from services.subscribers.middleware import TokenAuthMiddleware
+
+# -- benchmark tokens are told apart by their digest prefix --
+DIGEST_PREFIX = "bench"
+BATCH_SIZE = 10000
+
+
+async def accept(scope, receive, send):
+    return scope["user"]
+
+
+class Command(BaseCommand):
+    help = "measure websocket token authentication latency by table size"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tokens", type=int, nargs="+", default=[10000, 100000, 1000000]
+        )
+        parser.add_argument("--handshakes", type=int, default=200)
+        parser.add_argument("--legacy", action="store_true")
+        parser.add_argument("--cleanup", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["cleanup"]:
+            deleted, _ = AuthToken.objects.filter(
+                digest__startswith=DIGEST_PREFIX
+            ).delete()
+            self.stdout.write(f"deleted {deleted} rows")
+            return
+
+        user = User.objects.first()
+        if user is None:
+            raise CommandError("no user found, create one first")
+
+        for size in sorted(options["tokens"]):
+            keys = self.fill(user, size)
+            sample = random.sample(keys, min(options["handshakes"], len(keys)))
+
+            latencies = asyncio.run(self.handshakes(sample))
+            self.report(f"indexed {size}", latencies)
+
+            if options["legacy"]:
+                latencies = [self.legacy_lookup(key) for key in sample[:20]]
+                self.report(f"scan    {size}", latencies)
+
+    def fill(self, user, size):
+        """creates benchmark tokens up to size, returns their keys"""
+        queryset = AuthToken.objects.filter(digest__startswith=DIGEST_PREFIX)
+        keys = list(queryset.values_list("token_key", flat=True))
+
+        missing = size - len(keys)
+        if missing > 0:
+            self.stdout.write(f"creating {missing} tokens...")
+        while missing > 0:
+            tokens = [
+                AuthToken(
+                    digest=f"{DIGEST_PREFIX}{secrets.token_hex(60)}",
+                    token_key=secrets.token_hex(4),
+                    user=user,
+                )
+                for _ in range(min(missing, BATCH_SIZE))
+            ]
+            # -- bulk_create skips post_save, the hashes are
+            # created here like the migration backfill does --
+            AuthToken.objects.bulk_create(tokens)
+            AuthTokenHash.objects.bulk_create(
+                [
+                    AuthTokenHash(
+                        auth_token=token,
+                        key_hash=AuthTokenHash.hash_key(token.token_key),
+                    )
+                    for token in tokens
+                ]
+            )
+            keys += [token.token_key for token in tokens]
+            missing -= len(tokens)
+
+        return keys
+
+    async def handshakes(self, keys):
+        middleware = TokenAuthMiddleware(accept)
+        latencies = []
+        for key in keys:
+            scope = {
+                "type": "websocket",
+                "headers": [],
+                "query_string": f"tk={AuthTokenHash.hash_key(key)}".encode(),
+            }
+            start = time.perf_counter()
+            await middleware(scope, None, None)
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def legacy_lookup(self, key):
+        """the full scan the middleware used before AuthTokenHash"""
+        key_hash = AuthTokenHash.hash_key(key)
+        start = time.perf_counter()
+        for token in AuthToken.objects.all():
+            token_hash = hashlib.sha256(str(token.token_key).encode("utf-8"))
+            if token_hash.hexdigest() == key_hash:
+                token.user
+                break
+        return (time.perf_counter() - start) * 1000
+
+    def report(self, name, latencies):
+        if len(latencies) < 2:
+            self.stdout.write(f"{name}: not enough samples")
+            return
+
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{name}: p50={percentiles[49]:.2f}ms p95={percentiles[94]:.2f}ms "
+            f"p99={percentiles[98]:.2f}ms max={max(latencies):.2f}ms"
+        )
@@ -0,0 +1,77 @@
+"""compares JSON text and msgpack binary websocket frames
+
+usage:
+    python manage.py bench_ws_encoding --messages 10000
+
+encodes the same notification messages the way BaseConsumer does for
+each mode and reports bytes on the wire and server CPU time, with and
+without permessage-deflate (a per-connection deflate context, as the
+ASGI server keeps with context takeover).
+"""
+import json
+import time
+import uuid
+import zlib
+
+import msgpack
+from django.core.management.base import BaseCommand
+
+
+def build_message(index):
+    return {
+        "type": "send_notification",
+        "data": {
+            "status": "SUCCESS",
+            "message": f"your order #{100000 + index} has been shipped",
+            "order_id": str(uuid.uuid4()),
+            "amount": 1999 + index,
+            "items": [{"sku": f"SKU-{index % 50}", "quantity": index % 5 + 1}],
+        },
+        "cursor": f"{1700000000000000 + index}.{index}",
+    }
+
+
+def encode_json(message):
+    # -- what AsyncJsonWebsocketConsumer.encode_json does --
+    return json.dumps(message).encode("utf-8")
+
+
+def encode_msgpack(message):
+    return msgpack.packb(message)
+
+
+class Command(BaseCommand):
+    help = "compare bytes on the wire and cpu of JSON and msgpack frames"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        messages = [build_message(index) for index in range(options["messages"])]
+
+        for name, encode in (("json", encode_json), ("msgpack", encode_msgpack)):
+            for deflate in (False, True):
+                wire_bytes, cpu = self.run(messages, encode, deflate)
+                label = f"{name}{' + deflate' if deflate else ''}"
+                self.stdout.write(
+                    f"{label:<18} {wire_bytes / 1024:>10.1f} KiB "
+                    f"{cpu * 1000:>8.1f} ms cpu "
+                    f"({wire_bytes / len(messages):.0f} B/message)"
+                )
+
+    def run(self, messages, encode, deflate):
+        compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS) if deflate else None
+        wire_bytes = 0
+
+        start = time.process_time()
+        for message in messages:
+            frame = encode(message)
+            if compressor is not None:
+                # -- permessage-deflate flushes every message
+                # and strips the sync marker --
+                frame = compressor.compress(frame)
+                frame = (frame + compressor.flush(zlib.Z_SYNC_FLUSH))[:-4]
+            wire_bytes += len(frame)
+        cpu = time.process_time() - start
+
+        return wire_bytes, cpu
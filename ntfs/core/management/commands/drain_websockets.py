@@ -0,0 +1,33 @@
+"""drains the websocket connections of the ASGI nodes
+
+usage:
+    python manage.py drain_websockets
+    python manage.py drain_websockets --host ws-1 --window 120
+
+every node (or only --host) stops accepting connections, asks its
+clients to reconnect after a random delay and closes the remaining
+connections in waves over --window seconds. Run it before stopping a
+node on deploy, or send the ASGI processes WS_DRAIN["SIGNAL"] instead.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.management.base import BaseCommand
+
+from services.subscribers import drain
+
+
+class Command(BaseCommand):
+    help = "gracefully drain the websocket connections of the ASGI nodes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--window", type=int, default=drain.WINDOW)
+        parser.add_argument("--host", type=str, default=None)
+
+    def handle(self, *args, **options):
+        async_to_sync(drain.request_drain)(
+            get_channel_layer(), options["window"], options["host"]
+        )
+        self.stdout.write(
+            f"drain requested for {options['host'] or 'every node'} "
+            f"over {options['window']}s"
+        )
@@ -0,0 +1,54 @@
+"""starts a celery worker for one action queue
+
+usage:
+    python manage.py run_worker send_mail
+    python manage.py run_worker notify_user --concurrency 32
+
+the pool and concurrency default to PUBLISHER_WORKER_POOLS, the
+process is replaced by the celery cli so pools that need monkey
+patching (gevent) are set up the way celery expects, psycopg2 is
+then patched by config.celery when the worker starts.
+"""
+import os
+
+from django.core.management.base import BaseCommand
+
+from services.publishers.tasks.routing import get_queues, get_pool
+
+
+class Command(BaseCommand):
+    help = "start a celery worker consuming a single action queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument("queue", choices=get_queues())
+        parser.add_argument(
+            "--pool", choices=["prefork", "threads", "gevent", "eventlet", "solo"]
+        )
+        parser.add_argument("--concurrency", type=int)
+        parser.add_argument("--loglevel", default="info")
+
+    def handle(self, *args, **options):
+        queue = options["queue"]
+        pool = get_pool(queue)
+
+        argv = [
+            "celery",
+            "-A",
+            "config",
+            "worker",
+            "--queues",
+            queue,
+            "--hostname",
+            f"{queue}@%h",
+            "--pool",
+            options["pool"] or pool["pool"],
+            "--concurrency",
+            str(options["concurrency"] or pool["concurrency"]),
+            "--loglevel",
+            options["loglevel"],
+        ]
+        if pool.get("prefetch_multiplier"):
+            argv += ["--prefetch-multiplier", str(pool["prefetch_multiplier"])]
+
+        self.stdout.write(" ".join(argv))
+        os.execvp(argv[0], argv)
@@ -0,0 +1,18 @@
+# Generated by Django 4.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_eventlog_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventlog',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=255, null=True, unique=True),
+        ),
+    ]
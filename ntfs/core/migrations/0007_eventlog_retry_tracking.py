@@ -0,0 +1,27 @@
+# Generated by Django 4.1 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_eventlog_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventlog',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='eventlog',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='eventlog',
+            index=models.Index(condition=models.Q(('status', 'RETRY')), fields=['next_retry_at'], name='eventlog_retrying_idx'),
+        ),
+    ]
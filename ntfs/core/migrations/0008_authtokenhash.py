@@ -0,0 +1,47 @@
+# Generated by Django 4.1 on 2026-10-18 13:19
+
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def hash_existing_tokens(apps, schema_editor):
+    AuthToken = apps.get_model("knox", "AuthToken")
+    AuthTokenHash = apps.get_model("core", "AuthTokenHash")
+
+    hashes = (
+        AuthTokenHash(
+            auth_token_id=digest,
+            key_hash=hashlib.sha256(str(token_key).encode("utf-8")).hexdigest(),
+        )
+        for digest, token_key in AuthToken.objects.values_list(
+            "digest", "token_key"
+        ).iterator()
+    )
+    batch = []
+    for token_hash in hashes:
+        batch.append(token_hash)
+        if len(batch) == 5000:
+            AuthTokenHash.objects.bulk_create(batch)
+            batch = []
+    AuthTokenHash.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_eventlog_retry_tracking'),
+        ('knox', '0008_remove_authtoken_salt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthTokenHash',
+            fields=[
+                ('auth_token', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='key_hash', serialize=False, to='knox.authtoken')),
+                ('key_hash', models.CharField(db_index=True, max_length=64)),
+            ],
+        ),
+        migrations.RunPython(hash_existing_tokens, migrations.RunPython.noop),
+    ]
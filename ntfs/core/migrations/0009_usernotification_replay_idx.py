@@ -0,0 +1,17 @@
+# Generated by Django 4.1 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_authtokenhash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usernotification',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='usernotification_replay_idx'),
+        ),
+    ]
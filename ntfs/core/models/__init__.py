@@ -4,3 +4,4 @@
 from core.models.user import User, RefreshToken
 from core.models.role import Role # SystemPermission
 from core.models.notification_log import UserNotification, EventLog
+from core.models.token_hash import AuthTokenHash
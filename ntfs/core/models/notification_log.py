@@ -1,11 +1,21 @@
 from django.db import models
+import datetime
 import uuid
 
 
+CURSOR_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
 def get_log_body_default():
     return {}
 
 
+class EventLogQuerySet(models.QuerySet):
+    def retrying(self):
+        """events waiting for their next retry, soonest first"""
+        return self.filter(status="RETRY").order_by("next_retry_at")
+
+
 class EventLog(models.Model):
 
     STATUSES = [
@@ -14,6 +24,8 @@ class EventLog(models.Model):
         ("SUCCESS", "Completed"),
         ("RETRY", "Retrying")
     ]
+    # -- statuses a task can still move the event out of --
+    ACTIVE_STATUSES = ("STARTED", "RETRY")
 
     id = models.UUIDField(default=uuid.uuid4, primary_key=True)
     status = models.CharField(max_length=10, choices=STATUSES, default=STATUSES[0][0])
@@ -23,6 +35,34 @@ class EventLog(models.Model):
     body = models.JSONField(serialize=True, null=True, default=get_log_body_default)
     message = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    idempotency_key = models.CharField(
+        max_length=255, unique=True, null=True, blank=True
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_retry_at = models.DateTimeField(null=True, blank=True)
+
+    objects = EventLogQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # -- only events in retry are indexed --
+            models.Index(
+                fields=["next_retry_at"],
+                condition=models.Q(status="RETRY"),
+                name="eventlog_retrying_idx",
+            ),
+        ]
+
+
+class UserNotificationQuerySet(models.QuerySet):
+    def after(self, cursor):
+        """notifications after a cursor (see UserNotification.cursor),
+        in the order they were saved"""
+        timestamp, notification_id = UserNotification.parse_cursor(cursor)
+        return self.filter(
+            models.Q(timestamp__gt=timestamp)
+            | models.Q(timestamp=timestamp, id__gt=notification_id)
+        ).order_by("timestamp", "id")
 
 
 class UserNotification(models.Model):
@@ -31,3 +71,48 @@ class UserNotification(models.Model):
         "User", on_delete=models.CASCADE, related_name="notifications"
     )
     timestamp = models.DateTimeField(auto_now_add=True)
+
+    objects = UserNotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # -- replays are range scans of one user's notifications --
+            models.Index(
+                fields=["user", "timestamp", "id"],
+                name="usernotification_replay_idx",
+            ),
+        ]
+
+    @property
+    def cursor(self) -> str:
+        """position of the notification in its user's stream,
+        ``<microseconds since epoch>.<id>``"""
+        microseconds = (self.timestamp - CURSOR_EPOCH) // datetime.timedelta(
+            microseconds=1
+        )
+        return f"{microseconds}.{self.id}"
+
+    @staticmethod
+    def parse_cursor(cursor):
+        """returns the (timestamp, id) of a cursor, a cursor without
+        an id points after every notification of its timestamp
+
+        Raises
+        ------
+            ValueError: if the cursor is malformed
+        """
+        microseconds, _, notification_id = str(cursor).partition(".")
+        try:
+            timestamp = CURSOR_EPOCH + datetime.timedelta(
+                microseconds=int(microseconds)
+            )
+            if not notification_id:
+                return timestamp + datetime.timedelta(microseconds=1), 0
+        except OverflowError:
+            raise ValueError(f"cursor out of range: {cursor}")
+
+        notification_id = int(notification_id)
+        # -- ids are bigints in the database --
+        if not 0 <= notification_id < 2**63:
+            raise ValueError(f"cursor out of range: {cursor}")
+        return timestamp, notification_id
@@ -0,0 +1,37 @@
+"""token_hash.py
+sha256 of knox token keys, used by the websocket ``?tk=`` handshake
+
+Classes
+-------
+   -- AuthTokenHash class
+"""
+import hashlib
+
+from django.db import models
+from knox.models import AuthToken
+
+
+class AuthTokenHash(models.Model):
+    """indexed sha256 of an AuthToken's token_key
+
+    kept in sync by core.signals when a token is saved and deleted
+    with it, so a websocket client sending ``?tk=<sha256>`` is found
+    with a single indexed lookup instead of hashing every token.
+
+    Attributes
+    ----------
+        - auth_token: AuthToken, the hashed token
+        - key_hash: str, sha256 hex digest of auth_token.token_key
+    """
+
+    auth_token = models.OneToOneField(
+        AuthToken,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="key_hash",
+    )
+    key_hash = models.CharField(max_length=64, db_index=True)
+
+    @staticmethod
+    def hash_key(token_key) -> str:
+        return hashlib.sha256(str(token_key).encode("utf-8")).hexdigest()
@@ -0,0 +1,34 @@
+"""signal handlers of the core models"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from knox.models import AuthToken
+
+from core.models import AuthTokenHash, User
+from services.authservice.backends.principal_cache import principal_cache
+
+
+@receiver(post_save, sender=AuthToken)
+def save_auth_token_hash(sender, instance, update_fields=None, **kwargs):
+    """keeps the token's AuthTokenHash in sync with its token_key,
+    the hash is deleted with the token (on_delete=CASCADE)"""
+    # -- knox refreshes the expiry on every request,
+    # only saves that can change the key need a write --
+    if update_fields is not None and "token_key" not in update_fields:
+        return
+
+    AuthTokenHash.objects.update_or_create(
+        auth_token=instance,
+        defaults={"key_hash": AuthTokenHash.hash_key(instance.token_key)},
+    )
+
+
+@receiver(post_delete, sender=AuthToken)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """logout and expired tokens"""
+    principal_cache.invalidate_token(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """cached tokens hold a copy of the user"""
+    principal_cache.invalidate_user(instance)
@@ -152,7 +152,7 @@ class LoginAPIView(generics.GenericAPIView):
         self, instance, refresh_token, auth_token, iam_user
     ):
         print("duplicating token...")
-        cache = Cache(timeout=86400)
+        cache = Cache(timeout=86400, local=True)
         service_ids = iam_user.get("employee", {}).get("active_on", [])
 
         # print(service_ids)
@@ -319,7 +319,13 @@ class RefreshTokenView(APIView):
             instance, token = AuthToken.objects.create(user)  # type: ignore
 
             # Optionally, create a new refresh token and delete the old one
+            old_auth_token = refresh_token_instance.auth_token
             refresh_token_instance.delete()
+
+            # -- the refreshed token stops working, post_delete
+            # evicts it from the principal cache everywhere --
+            if old_auth_token is not None:
+                old_auth_token.delete()
             new_refresh_token = self.create_refresh_token(instance)
 
             return Response(
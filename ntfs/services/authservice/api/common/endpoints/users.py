@@ -40,7 +40,7 @@ from django.db import transaction
 
 from typing import Any
 
-cache = Cache()
+cache = Cache(local=True, stale_ttl=60, codec="compact")
 
 
 class UserViewset(AccessViewSetMixin, viewsets.ViewSet, viewsets.ModelViewSet):
@@ -166,42 +166,31 @@ class UserViewset(AccessViewSetMixin, viewsets.ViewSet, viewsets.ModelViewSet):
                 "page", None
             ), request.query_params.get("page_size", None)
 
-            if page is None and page_size is None:
-                cached_results = cache.get("users")
-
-            else:
+            if page is not None or page_size is not None:
                 paginate = {"page": page, "page_size": page_size}
-                cached_results = cache.get("users", paginate)
-
-            if cached_results is not None:
-                return Response(
-                    data=cached_results, status=status.HTTP_200_OK, exception=False
-                )
-
-            queryset = self.get_queryset()
 
-            queryset_page = self.paginate_queryset(queryset)
+            # -- only one request rebuilds the list when it expires
+            # or is invalidated, the others get the stale list or wait --
+            data = cache.get_or_set(
+                "users", self.get_list_data, paginate, store_keys=True
+            )
+        except Exception as error:
+            response = exception_handler(error, "An error occured")
+            return handle_error_response(response, error)
 
-            serializer = UserSerializer(queryset, many=True)
+        return Response(data=data, status=status.HTTP_200_OK)
 
-            users = serializer.data
+    def get_list_data(self):
+        queryset = self.get_queryset()
 
-            # print(users)
-            # print(page)
+        queryset_page = self.paginate_queryset(queryset)
 
-            if queryset_page is not None:
-                paginated_response = self.get_paginated_response(serializer.data)
-                cache.set("users", paginated_response.data, paginate)
+        serializer = UserSerializer(queryset, many=True)
 
-                return paginated_response
-        except Exception as error:
-            response = exception_handler(error, "An error occured")
-            return handle_error_response(response, error)
+        if queryset_page is not None:
+            return self.get_paginated_response(serializer.data).data
 
-        data = format_response_data(users, 200)
-        response = Response(data, status=status.HTTP_200_OK)
-        cache.set("users", response.data)
-        return response
+        return format_response_data(serializer.data, 200)
 
     @transaction.atomic
     def update(self, request, *args, **kwargs) -> Response:
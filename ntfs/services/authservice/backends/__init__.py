@@ -1 +1,2 @@
-from .oauth2backend import OAuth2ClientCredentialAuthentication
\ No newline at end of file
+from .oauth2backend import OAuth2ClientCredentialAuthentication
+from .knox_cached import CachedTokenAuthentication
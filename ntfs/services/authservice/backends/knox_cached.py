@@ -0,0 +1,35 @@
+import binascii
+
+from django.utils.translation import gettext_lazy as _
+from knox.auth import TokenAuthentication
+from knox.crypto import hash_token
+from knox.settings import CONSTANTS
+from rest_framework import exceptions
+
+from .principal_cache import principal_cache, token_cache_key
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    knox TokenAuthentication with the resolved token cached by
+    PrincipalCache, a cached token is authenticated without a query.
+
+    Tokens are still renewed (AUTO_REFRESH) when they are resolved
+    from the database, at most every PRINCIPAL_CACHE["TTL"] seconds.
+    """
+
+    def authenticate_credentials(self, token):
+        token_string = token.decode("utf-8")
+        try:
+            digest = hash_token(token_string)
+        except (TypeError, binascii.Error):
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+
+        key = token_cache_key(token_string[: CONSTANTS.TOKEN_KEY_LENGTH], digest)
+        auth_token = principal_cache.get(key)
+        if auth_token is not None:
+            return self.validate_user(auth_token)
+
+        user, auth_token = super().authenticate_credentials(token)
+        principal_cache.set(key, auth_token)
+        return user, auth_token
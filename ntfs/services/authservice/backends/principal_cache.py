@@ -0,0 +1,137 @@
+"""token to principal cache
+
+resolving a token to its user costs a query (and knox's digest
+compare) on every REST request and websocket handshake. Resolved
+AuthTokens, with their user, are kept in the in-process (L1) cache of
+services.utils.cache and, when PRINCIPAL_CACHE["REDIS"] is set, in the
+default cache shared across nodes.
+
+entries are keyed by the token key plus its digest (or the ``?tk=``
+hash for websockets), expire with the token or after
+PRINCIPAL_CACHE["TTL"] seconds, whichever comes first, and are
+deleted when the token is deleted and when its user is saved, in
+every process through the L1 invalidation channel. Like the L1, the
+in-process tier is only used while that subscription is up.
+"""
+from django.conf import settings
+from django.utils import timezone
+
+from services.utils import Cache
+from services.utils.cache import (
+    L1_ENABLED,
+    invalidator,
+    local_cache,
+    publish_invalidation,
+)
+
+PRINCIPAL_CACHE = getattr(settings, "PRINCIPAL_CACHE", {})
+ENABLED = PRINCIPAL_CACHE.get("ENABLED", True)
+TTL = PRINCIPAL_CACHE.get("TTL", 60)
+REDIS = PRINCIPAL_CACHE.get("REDIS", False)
+
+
+LOCAL_PREFIX = "principal:"
+
+
+def token_cache_key(token_key, digest):
+    return f"token:{token_key}:{digest}"
+
+
+def tk_cache_key(key_hash):
+    return f"tk:{key_hash}"
+
+
+def is_expired(auth_token):
+    return auth_token.expiry is not None and auth_token.expiry <= timezone.now()
+
+
+class PrincipalCache:
+    """
+    Two tier cache of resolved AuthTokens
+
+    Methods
+    -------
+        get: Get the cached AuthToken, None on a miss or if expired
+        set: Cache a resolved AuthToken
+        invalidate_token: Delete every entry of a token
+        invalidate_user: Delete the entries of every token of a user
+    """
+
+    def __init__(self, ttl=TTL, redis=REDIS, enabled=ENABLED, local=L1_ENABLED):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.local = local
+        self.shared = Cache(prefix="principal_", timeout=ttl) if redis else None
+
+    def local_key(self, key):
+        return f"{LOCAL_PREFIX}{key}"
+
+    def get_local(self, key):
+        """None on a miss or while other processes'
+        invalidations can't reach this one"""
+        if not self.local:
+            return None
+
+        invalidator.start()
+        if not invalidator.is_connected():
+            return None
+        return local_cache.get(self.local_key(key))
+
+    def set_local(self, key, auth_token, ttl):
+        if self.local and invalidator.is_connected():
+            local_cache.set(self.local_key(key), auth_token, ttl)
+
+    def get_ttl(self, auth_token):
+        if auth_token.expiry is None:
+            return self.ttl
+        remaining = (auth_token.expiry - timezone.now()).total_seconds()
+        return int(min(self.ttl, remaining))
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+
+        auth_token = self.get_local(key)
+        if auth_token is None and self.shared is not None:
+            auth_token = self.shared.get(key)
+            if auth_token is not None:
+                self.set_local(key, auth_token, self.get_ttl(auth_token))
+
+        if auth_token is None or is_expired(auth_token):
+            return None
+        return auth_token
+
+    def set(self, key, auth_token):
+        if not self.enabled:
+            return
+
+        ttl = self.get_ttl(auth_token)
+        if ttl <= 0:
+            return
+
+        self.set_local(key, auth_token, ttl)
+        if self.shared is not None:
+            self.shared.set(key, auth_token, timeout=ttl)
+
+    def delete(self, *keys):
+        """deletes keys here, in every other process and in the shared cache"""
+        if self.local:
+            publish_invalidation(keys=[self.local_key(key) for key in keys])
+        if self.shared is not None:
+            for key in keys:
+                self.shared.invalidate(key)
+
+    def invalidate_token(self, auth_token):
+        from core.models import AuthTokenHash
+
+        self.delete(
+            token_cache_key(auth_token.token_key, auth_token.digest),
+            tk_cache_key(AuthTokenHash.hash_key(auth_token.token_key)),
+        )
+
+    def invalidate_user(self, user):
+        for auth_token in user.auth_token_set.all():
+            self.invalidate_token(auth_token)
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,146 @@
+"""publishes celery task messages straight from the event loop
+
+celery's ``apply_async`` is blocking, calling it from an async view
+needs a thread handoff, this publisher writes the task message
+(celery message protocol v2) to the broker with aiormq instead.
+"""
+import asyncio
+import json
+import os
+import socket
+import uuid
+
+import aiormq
+from django.conf import settings
+
+from config.celery import app
+
+
+class AsyncTaskPublisher:
+    """keeps one broker connection per event loop and
+    publishes celery tasks on it
+
+    Example
+    -------
+        >>> publisher = AsyncTaskPublisher()
+        >>> await publisher.send_task(
+        ...     "services.publishers.tasks.handler.handle_event", args=[event_id]
+        ... )
+    """
+
+    def __init__(self, url=None):
+        self.url = url or settings.CELERY_BROKER_URL
+        self.origin = f"{os.getpid()}@{socket.gethostname()}"
+        self._loop = None
+        self._lock = None
+        self._connection = None
+        self._channel = None
+        self._declared = set()
+
+    async def get_channel(self):
+        loop = asyncio.get_running_loop()
+
+        # -- connections are bound to the loop
+        # that opened them --
+        if self._loop is not loop:
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._connection = None
+            self._channel = None
+
+        async with self._lock:
+            if self._connection is None or self._connection.is_closed:
+                self._connection = await aiormq.connect(self.url)
+                self._channel = None
+
+            if self._channel is None or self._channel.is_closed:
+                self._channel = await self._connection.channel()
+                self._declared = set()
+
+        return self._channel
+
+    async def declare(self, channel, queue):
+        """declares the queue, its exchange and binding once per
+        channel like kombu does, publishing to an exchange no worker
+        declared yet would close the channel with NOT_FOUND"""
+        if queue.name in self._declared:
+            return
+
+        exchange = queue.exchange
+        if exchange.name:
+            await channel.exchange_declare(
+                exchange=exchange.name,
+                exchange_type=exchange.type,
+                durable=exchange.durable,
+                auto_delete=exchange.auto_delete,
+                arguments=exchange.arguments,
+            )
+        await channel.queue_declare(
+            queue=queue.name,
+            durable=queue.durable,
+            exclusive=queue.exclusive,
+            auto_delete=queue.auto_delete,
+            arguments=queue.queue_arguments,
+        )
+        if exchange.name:
+            await channel.queue_bind(
+                queue=queue.name,
+                exchange=exchange.name,
+                routing_key=queue.routing_key,
+                arguments=queue.binding_arguments,
+            )
+        self._declared.add(queue.name)
+
+    def build_message(self, task_id, name, args, kwargs):
+        headers = {
+            "lang": "py",
+            "task": name,
+            "id": task_id,
+            "shadow": None,
+            "eta": None,
+            "expires": None,
+            "group": None,
+            "group_index": None,
+            "retries": 0,
+            "timelimit": [None, None],
+            "root_id": task_id,
+            "parent_id": None,
+            "argsrepr": repr(args),
+            "kwargsrepr": repr(kwargs),
+            "origin": self.origin,
+            "ignore_result": False,
+        }
+        embed = {"callbacks": None, "errbacks": None, "chain": None, "chord": None}
+        body = json.dumps([args, kwargs, embed]).encode("utf-8")
+        return headers, body
+
+    async def send_task(self, name, args=None, kwargs=None):
+        """publishes a task message and returns its task id"""
+        args = list(args or [])
+        kwargs = kwargs or {}
+        task_id = str(uuid.uuid4())
+
+        # -- use celery's own router so the message
+        # lands on the same queue apply_async would use --
+        queue = app.amqp.router.route({}, name, args, kwargs)["queue"]
+        headers, body = self.build_message(task_id, name, args, kwargs)
+
+        channel = await self.get_channel()
+        await self.declare(channel, queue)
+        await channel.basic_publish(
+            body,
+            exchange=queue.exchange.name,
+            routing_key=queue.routing_key,
+            properties=aiormq.spec.Basic.Properties(
+                content_type="application/json",
+                content_encoding="utf-8",
+                correlation_id=task_id,
+                delivery_mode=2,
+                priority=0,
+                headers=headers,
+            ),
+        )
+        return task_id
+
+
+publisher = AsyncTaskPublisher()
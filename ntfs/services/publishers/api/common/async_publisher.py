@@ -0,0 +1,95 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import serializers
+
+from ...tasks.handler import TWO_HOP_DISPATCH, EventFactory
+from .async_broker import publisher
+from .serializers import BatchEventSerializer
+from . import idempotency
+
+from services.exceptions import handle_error_response
+from services.exceptions import exception_handler
+
+from core.models import EventLog
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class BaseAsyncEventPublisherView(View):
+    """publishes an event without leaving the event loop
+
+    unlike BaseEventPublisherView this is a native async django view,
+    validation doesn't touch the database, the user is checked by the
+    event log foreign key on insert and the task message is published
+    with the async broker publisher.
+    """
+
+    http_method_names = ["post"]
+    task_name = "services.publishers.tasks.handler.handle_event"
+
+    async def dispatch_event(self, event_id, data):
+        if TWO_HOP_DISPATCH:
+            return await publisher.send_task(self.task_name, args=[event_id])
+
+        action = EventFactory.ACTIONS[data["action"]]
+        notification = data.get("notification") or {}
+        return await publisher.send_task(
+            action.name, args=[data, event_id, notification]
+        )
+
+    def handle_error(self, error, context="An error has occurred"):
+        response = exception_handler(error, context)
+        response = handle_error_response(response, error)
+        return JsonResponse(response.data, status=response.status_code)
+
+    def validate_data(self, body):
+        try:
+            data = json.loads(body)
+        except ValueError as error:
+            raise serializers.ValidationError(f"JSON parse error - {error}")
+
+        serializer = BatchEventSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.get_body()
+
+    async def create_event_log(self, user_id, data, idempotency_key=None):
+        try:
+            if idempotency_key is None:
+                event = await EventLog.objects.acreate(user_id=user_id, body=data)
+                return str(event.id), True
+
+            # -- the key lookup and the insert share one handoff --
+            return await sync_to_async(idempotency.publish_once)(
+                idempotency_key,
+                lambda: EventLog.objects.create(
+                    user_id=user_id, body=data, idempotency_key=idempotency_key
+                ),
+            )
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {"user": [f'Invalid pk "{user_id}" - object does not exist.']}
+            )
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            data = self.validate_data(request.body)
+            key = idempotency.get_key(data, request.headers)
+            event_id, created = await self.create_event_log(data["user"], data, key)
+            if created:
+                await self.dispatch_event(event_id, data)
+        except Exception as error:
+            return self.handle_error(error)
+
+        return JsonResponse(
+            {
+                "status": 200,
+                "message": "Event published" if created else "Event already published",
+                "event_id": event_id,
+            },
+            status=200,
+        )
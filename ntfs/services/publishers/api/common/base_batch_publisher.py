@@ -0,0 +1,206 @@
+from django.conf import settings
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework import status, permissions, serializers
+from rest_framework.views import APIView
+
+from ...tasks.handler import dispatch_events
+from .serializers import BatchEventSerializer
+from . import idempotency
+
+from services.exceptions import handle_error_response
+from services.exceptions import exception_handler
+
+from core.models import EventLog, User
+
+MAX_BATCH_SIZE = getattr(settings, "PUBLISHER_MAX_BATCH_SIZE", 1000)
+
+
+def validate_events(indexed_items):
+    """validates a list of (index, event) pairs together
+
+    users are checked with a single query instead of one
+    query per event.
+
+    Returns
+    -------
+        (valid, results): a list of (index, data) tuples for valid events
+        and a per-item result list for the rejected ones
+    """
+    valid, results = [], []
+
+    for index, item in indexed_items:
+        serializer = BatchEventSerializer(data=item)
+        if not serializer.is_valid():
+            results.append(
+                {"index": index, "status": "rejected", "errors": serializer.errors}
+            )
+            continue
+
+        try:
+            # -- the same key rules as a single publish, the
+            # serializer would turn a number into a string --
+            idempotency.get_key(item)
+        except serializers.ValidationError as error:
+            results.append({"index": index, "status": "rejected", "errors": error.detail})
+            continue
+
+        valid.append((index, serializer.get_body(), serializer.validated_data["user"]))
+
+    user_ids = {user_id for _, _, user_id in valid}
+    existing = set(
+        User.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True)
+    )
+
+    accepted = []
+    for index, item, user_id in valid:
+        if user_id in existing:
+            accepted.append((index, item))
+        else:
+            results.append(
+                {
+                    "index": index,
+                    "status": "rejected",
+                    "errors": {"user": [f'Invalid pk "{user_id}" - object does not exist.']},
+                }
+            )
+
+    return accepted, results
+
+
+def create_event_logs(accepted):
+    """inserts all event logs with one bulk insert
+
+    events whose idempotency key was already published inside the
+    window (or earlier in the same batch) are not inserted again.
+
+    Returns
+    -------
+        (events, results): the created events and their per-item results
+    """
+    keys = {item["idempotency_key"] for _, item in accepted if item.get("idempotency_key")}
+    published = idempotency.lookup_many(keys)
+
+    results, new, seen = [], [], {}
+    for index, item in accepted:
+        key = item.get("idempotency_key") or None
+        if key in published:
+            results.append(
+                {"index": index, "status": "duplicate", "event_id": published[key]}
+            )
+        elif key is not None and key in seen:
+            seen[key].append(index)
+        else:
+            if key is not None:
+                seen[key] = []
+            new.append((index, item, EventLog(user_id=item["user"], body=item, idempotency_key=key)))
+
+    events = [event for _, _, event in new]
+    if seen:
+        # -- conflicting keys were published concurrently,
+        # the rows that already exist win --
+        idempotency.release_expired(list(seen))
+        EventLog.objects.bulk_create(events, ignore_conflicts=True)
+        stored = {
+            key: (event_id, created_at)
+            for key, event_id, created_at in EventLog.objects.filter(
+                idempotency_key__in=list(seen)
+            ).values_list("idempotency_key", "id", "created_at")
+        }
+        idempotency.remember_many(stored)
+        owners = {key: str(event_id) for key, (event_id, _) in stored.items()}
+    else:
+        EventLog.objects.bulk_create(events)
+        owners = {}
+
+    created = []
+    for index, item, event in new:
+        key = event.idempotency_key
+        event_id = owners.get(key, str(event.id))
+        if event_id == str(event.id):
+            created.append(event)
+            results.append({"index": index, "status": "accepted", "event_id": event_id})
+        else:
+            results.append({"index": index, "status": "duplicate", "event_id": event_id})
+
+        for duplicate in seen.get(key, []):
+            results.append(
+                {"index": duplicate, "status": "duplicate", "event_id": event_id}
+            )
+
+    return created, results
+
+
+def mark_failed(events, error):
+    """marks events that couldn't be dispatched as failed and
+    frees their idempotency keys, so a retry publishes them again"""
+    EventLog.objects.filter(id__in=[event.id for event in events]).update(
+        status="FAILURE",
+        message=f"dispatch failed: {error}",
+        updated_at=timezone.now(),
+        idempotency_key=None,
+    )
+    idempotency.forget([event.idempotency_key for event in events if event.idempotency_key])
+
+
+class BaseBatchEventPublisherView(APIView):
+    """publishes many events in a single request
+
+    accepts either a list of events or ``{"events": [...]}``,
+    every item is validated on its own so a bad event doesn't
+    reject the whole batch.
+    """
+
+    http_method_names = ["post"]
+    permission_classes = [permissions.AllowAny]
+
+    def handle_error(self, error, context="An error has occurred"):
+        response = exception_handler(error, context)
+        return handle_error_response(response, error)
+
+    def get_events(self, data):
+        events = data.get("events") if isinstance(data, dict) else data
+
+        if not isinstance(events, list) or not events:
+            raise serializers.ValidationError(
+                {"events": ["Expected a non-empty list of events."]}
+            )
+
+        if len(events) > MAX_BATCH_SIZE:
+            raise serializers.ValidationError(
+                {"events": [f"A batch can contain at most {MAX_BATCH_SIZE} events."]}
+            )
+
+        return events
+
+    def post(self, request, *args, **kwargs):
+        try:
+            items = self.get_events(request.data)
+            accepted, rejected = validate_events(enumerate(items))
+            events, results = create_event_logs(accepted)
+        except Exception as error:
+            return self.handle_error(error)
+
+        try:
+            if events:
+                dispatch_events([(str(event.id), event.body) for event in events])
+        except Exception as error:
+            # -- the rows exist but will never run --
+            mark_failed(events, error)
+            return self.handle_error(error, "events could not be dispatched")
+
+        duplicates = len(results) - len(events)
+        results = sorted(results + rejected, key=lambda result: result["index"])
+        published = bool(events or duplicates)
+
+        return Response(
+            data={
+                "status": 200 if published else 400,
+                "message": "Events published" if published else "No event was published",
+                "accepted": len(events),
+                "duplicates": duplicates,
+                "rejected": len(rejected),
+                "results": results,
+            },
+            status=status.HTTP_200_OK if published else status.HTTP_400_BAD_REQUEST,
+        )
@@ -0,0 +1,57 @@
+from django.db.models.fields.json import KeyTextTransform
+from rest_framework import generics, permissions
+from rest_framework.response import Response
+from oauth2_provider.contrib.rest_framework import TokenHasReadWriteScope
+
+from core.models import EventLog
+from services.exceptions import exception_handler, handle_error_response
+from services.utils.custom_pagination import CustomPagination
+from services.utils.functions import format_response_data
+from .serializers import RetryingEventLogSerializer
+
+
+class BaseRetryingEventListView(generics.ListAPIView):
+    """lists events currently waiting for a retry, soonest retry first
+
+    Query Parameters
+    ----------------
+        action (str): only events of this action, ex. send_sms
+        user (str): only events of this user
+    """
+
+    permission_classes = [permissions.IsAuthenticated | TokenHasReadWriteScope]
+    pagination_class = CustomPagination
+    serializer_class = RetryingEventLogSerializer
+
+    def get_queryset(self):
+        # -- served by the partial index on RETRY events,
+        # only the action is read from the body --
+        queryset = (
+            EventLog.objects.retrying()
+            .annotate(action=KeyTextTransform("action", "body"))
+            .defer("body")
+        )
+
+        action = self.request.query_params.get("action")
+        if action:
+            queryset = queryset.filter(body__action=action)
+
+        user = self.request.query_params.get("user")
+        if user:
+            queryset = queryset.filter(user_id=user)
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        try:
+            queryset = self.get_queryset()
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+
+            serializer = self.get_serializer(queryset, many=True)
+        except Exception as error:
+            response = exception_handler(error, "An error occured")
+            return handle_error_response(response, error)
+
+        return Response(format_response_data(serializer.data, 200))
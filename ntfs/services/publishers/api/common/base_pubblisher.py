@@ -2,12 +2,13 @@ from rest_framework.response import Response
 from rest_framework import status, permissions, serializers, filters
 from rest_framework.views import APIView
 import asyncio
-from ...tasks.handler import handle_event
+from ...tasks.handler import dispatch_event
 from .serializers import EventSerializer, EventLogSerializer
 
 from services.exceptions import handle_error_response
 from services.exceptions import exception_handler
 from .permissions import AllowedIPsOnly
+from . import idempotency
 
 from asgiref.sync import sync_to_async, async_to_sync
 from channels.db import database_sync_to_async
@@ -26,16 +27,21 @@ class BaseEventPublisherView(APIView):
 
     @sync_to_async
     def validate_data(self, data):
-        data = EventSerializer(data=data)
-        data.is_valid(raise_exception=True)
+        serializer = EventSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.get_body()
 
     @sync_to_async
-    def create_event_log(self, user_id, data):
+    def create_event_log(self, user_id, data, idempotency_key=None):
         print("creating event log")
-        user = User.objects.get(user_id=user_id)
-        event = EventLog.objects.create(user=user, body=data)
-        event.save()
-        return event
+        # -- the user was already checked by the serializer,
+        # a retried publish returns the original event id --
+        return idempotency.publish_once(
+            idempotency_key,
+            lambda: EventLog.objects.create(
+                user_id=user_id, body=data, idempotency_key=idempotency_key
+            ),
+        )
 
     @sync_to_async
     def create_user_notification(self, user):
@@ -45,20 +51,29 @@ class BaseEventPublisherView(APIView):
     async def post(self, request, *args, **kwargs):
         try:
 
-            await self.validate_data(request.data)
-
-            data = request.data
+            data = await self.validate_data(request.data)
             user = data["user"]
-            event = await self.create_event_log(user, data)
+            key = idempotency.get_key(data, request.headers)
+            event_id, created = await self.create_event_log(user, data, key)
 
         except Exception as error:
             return await self.handle_error(error)
 
+        if not created:
+            return Response(
+                data={
+                    "status": 200,
+                    "message": "Event already published",
+                    "event_id": event_id,
+                },
+                status=status.HTTP_200_OK,
+            )
+
         # Process the event asynchronously
         # asyncio.create_task(handle_event(event))
-        handle_event.apply_async(args=[event.id])
+        dispatch_event(event_id, data)
         return Response(
-            data={"status": 200, "message": "Event published"},
+            data={"status": 200, "message": "Event published", "event_id": event_id},
             status=status.HTTP_200_OK,
         )
 
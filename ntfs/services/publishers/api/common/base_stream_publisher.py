@@ -0,0 +1,153 @@
+import json
+from itertools import islice
+
+import msgpack
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import permissions
+from rest_framework.views import APIView
+
+from ...tasks.handler import dispatch_events
+from .base_batch_publisher import validate_events, create_event_logs, mark_failed
+
+CHUNK_SIZE = getattr(settings, "PUBLISHER_STREAM_CHUNK_SIZE", 500)
+READ_SIZE = 64 * 1024
+
+MSGPACK_CONTENT_TYPES = ("application/msgpack", "application/x-msgpack")
+
+
+class InvalidEvent:
+    """placeholder for a line that couldn't be decoded"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def dumps(data):
+    return json.dumps(data, default=str) + "\n"
+
+
+class BaseStreamEventPublisherView(APIView):
+    """ingests newline delimited JSON (or msgpack) events
+
+    the request body is read incrementally, events are validated,
+    inserted and dispatched in fixed size chunks so the whole body is
+    never held in memory. The response is streamed as NDJSON, one
+    progress line per chunk and a summary line at the end.
+
+    the response is an async generator so the ASGI server streams it,
+    each chunk is read and published in a worker thread.
+    """
+
+    http_method_names = ["post"]
+    permission_classes = [permissions.AllowAny]
+    chunk_size = CHUNK_SIZE
+
+    def read_ndjson(self, stream):
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                yield InvalidEvent(f"JSON parse error - {error}")
+
+    def read_msgpack(self, stream):
+        unpacker = msgpack.Unpacker(raw=False)
+        while data := stream.read(READ_SIZE):
+            unpacker.feed(data)
+            yield from unpacker
+
+    def read_events(self, request):
+        # -- read from the underlying django request,
+        # request.data would buffer the whole body --
+        content_type = request.content_type.split(";")[0].strip()
+        if content_type in MSGPACK_CONTENT_TYPES:
+            return self.read_msgpack(request._request)
+        return self.read_ndjson(request._request)
+
+    def publish_chunk(self, chunk, offset):
+        invalid = [
+            {"index": index, "status": "rejected", "errors": [item.error]}
+            for index, item in enumerate(chunk, start=offset)
+            if isinstance(item, InvalidEvent)
+        ]
+        items = [
+            (index, item)
+            for index, item in enumerate(chunk, start=offset)
+            if not isinstance(item, InvalidEvent)
+        ]
+
+        accepted, rejected = validate_events(items)
+
+        events, results = create_event_logs(accepted)
+        try:
+            if events:
+                dispatch_events([(str(event.id), event.body) for event in events])
+        except Exception as error:
+            # -- the rows exist but will never run --
+            mark_failed(events, error)
+            raise
+
+        duplicates = len(results) - len(events)
+        return events, duplicates, sorted(invalid + rejected, key=lambda result: result["index"])
+
+    def publish_next_chunk(self, chunks, offset):
+        """reads and publishes the next chunk, None once the body is read"""
+        chunk = next(chunks, None)
+        if chunk is None:
+            return None
+
+        events, duplicate_count, rejected_items = self.publish_chunk(chunk, offset)
+        return len(chunk), events, duplicate_count, rejected_items
+
+    async def ingest(self, request):
+        accepted = duplicates = rejected = offset = 0
+        chunks = iter_chunks(self.read_events(request), self.chunk_size)
+        publish_next_chunk = sync_to_async(self.publish_next_chunk)
+
+        try:
+            while (result := await publish_next_chunk(chunks, offset)) is not None:
+                size, events, duplicate_count, rejected_items = result
+                offset += size
+                accepted += len(events)
+                duplicates += duplicate_count
+                rejected += len(rejected_items)
+
+                yield dumps(
+                    {
+                        "type": "progress",
+                        "received": offset,
+                        "accepted": accepted,
+                        "duplicates": duplicates,
+                        "rejected": rejected,
+                        "errors": rejected_items,
+                    }
+                )
+        except Exception as error:
+            # -- the status line was already sent,
+            # report the error in the stream --
+            yield dumps({"type": "error", "received": offset, "error": str(error)})
+
+        yield dumps(
+            {
+                "type": "summary",
+                "received": offset,
+                "accepted": accepted,
+                "duplicates": duplicates,
+                "rejected": rejected,
+            }
+        )
+
+    def post(self, request, *args, **kwargs):
+        return StreamingHttpResponse(
+            self.ingest(request), content_type="application/x-ndjson"
+        )
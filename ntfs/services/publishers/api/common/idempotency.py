@@ -0,0 +1,164 @@
+"""idempotency keys for published events
+
+an event can carry an ``idempotency_key`` (or an ``Idempotency-Key``
+header), a retried publish with the same key inside
+PUBLISHER_IDEMPOTENCY_WINDOW returns the original event id instead of
+creating and dispatching a new event.
+
+keys are looked up in the cache first and then through the unique
+index on EventLog.idempotency_key. A cached key expires when the
+window of its event ends, not WINDOW seconds after it was cached.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from core.models import EventLog
+from services.utils import Cache
+
+WINDOW = getattr(settings, "PUBLISHER_IDEMPOTENCY_WINDOW", 3600 * 24)
+MAX_KEY_LENGTH = 255
+
+cache = Cache(prefix="idempotency_", timeout=WINDOW)
+
+
+def get_key(data, headers=None):
+    """returns the idempotency key of an event, if any"""
+    key = data.get("idempotency_key") if isinstance(data, dict) else None
+    if key is None and headers is not None:
+        key = headers.get("Idempotency-Key")
+
+    if key is not None and (not isinstance(key, str) or len(key) > MAX_KEY_LENGTH):
+        raise serializers.ValidationError(
+            {"idempotency_key": [f"Must be a string of at most {MAX_KEY_LENGTH} characters."]}
+        )
+    return key or None
+
+
+def get_cutoff():
+    return timezone.now() - datetime.timedelta(seconds=WINDOW)
+
+
+def get_timeout(created_at=None):
+    """seconds left in the window of an event created at created_at"""
+    if created_at is None:
+        return WINDOW
+    remaining = WINDOW - (timezone.now() - created_at).total_seconds()
+    return max(1, int(remaining))
+
+
+def lookup(key):
+    """returns the id of the event published with this key
+    inside the window or None"""
+    event_id = cache.get(key)
+    if event_id is not None:
+        return event_id
+
+    row = (
+        EventLog.objects.filter(idempotency_key=key, created_at__gte=get_cutoff())
+        .values_list("id", "created_at")
+        .first()
+    )
+    if row is None:
+        return None
+
+    event_id, created_at = row
+    remember(key, event_id, created_at)
+    return str(event_id)
+
+
+def lookup_many(keys):
+    """bulk version of lookup, returns a {key: event_id} dict"""
+    if not keys:
+        return {}
+
+    cached = cache.get_many(keys) or {}
+    found = {
+        key: cached[cache._generate_cache_key(key)]
+        for key in keys
+        if cached.get(cache._generate_cache_key(key)) is not None
+    }
+
+    missing = [key for key in keys if key not in found]
+    if missing:
+        stored = {
+            key: (event_id, created_at)
+            for key, event_id, created_at in EventLog.objects.filter(
+                idempotency_key__in=missing, created_at__gte=get_cutoff()
+            ).values_list("idempotency_key", "id", "created_at")
+        }
+        remember_many(stored)
+        found.update({key: str(event_id) for key, (event_id, _) in stored.items()})
+
+    return found
+
+
+def remember(key, event_id, created_at=None):
+    cache.set(key, str(event_id), timeout=get_timeout(created_at))
+
+
+def remember_many(published):
+    """caches a {key: (event_id, created_at)} dict, until
+    the window of the oldest event ends"""
+    if published:
+        timeout = min(get_timeout(created_at) for _, created_at in published.values())
+        cache.set_many(
+            {key: str(event_id) for key, (event_id, _) in published.items()},
+            timeout=timeout,
+        )
+
+
+def forget(keys):
+    """drops cached keys whose events gave them up,
+    so they can be published again"""
+    if keys:
+        cache.invalidate_many(keys=[cache._generate_cache_key(key) for key in keys])
+
+
+def release_expired(keys):
+    """frees keys held by events older than the window
+    so they can be used again"""
+    if keys:
+        EventLog.objects.filter(
+            idempotency_key__in=keys, created_at__lt=get_cutoff()
+        ).update(idempotency_key=None)
+
+
+def publish_once(key, create):
+    """creates an event unless one was already published with the key
+
+    Parameters
+    ----------
+        key (str | None): the event's idempotency key
+        create (callable): creates and returns the EventLog
+
+    Returns
+    -------
+        (event_id, created): created is False for a duplicate publish
+    """
+    if key is None:
+        return str(create().id), True
+
+    event_id = lookup(key)
+    if event_id is not None:
+        return event_id, False
+
+    try:
+        with transaction.atomic():
+            event = create()
+    except IntegrityError:
+        # -- either a concurrent publish won the race
+        # or the key is held by an expired event --
+        event_id = lookup(key)
+        if event_id is not None:
+            return event_id, False
+
+        release_expired([key])
+        with transaction.atomic():
+            event = create()
+
+    remember(key, event.id, event.created_at)
+    return str(event.id), True
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from core.models import User, EventLog
+from services.subscribers.sessions import ID_PATTERN
 
 
 class EventLogSerializer(serializers.ModelSerializer):
@@ -9,12 +10,33 @@ class EventLogSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class RetryingEventLogSerializer(serializers.ModelSerializer):
+    action = serializers.CharField(read_only=True)
+
+    class Meta:
+        model = EventLog
+        fields = [
+            "id",
+            "user",
+            "action",
+            "status",
+            "message",
+            "attempts",
+            "next_retry_at",
+            "created_at",
+            "updated_at",
+        ]
+
+
 class EventSerializer(serializers.Serializer):
     ACTIONS = [
         "notify_user",
         "send_sms",
         "send_mail",
+        "broadcast",
     ]
+    RECIPIENT_TYPES = ["users", "groups", "roles"]
+
     notification = serializers.JSONField(required=False)
     action = serializers.ChoiceField(choices=ACTIONS, required=True)
     payload = serializers.JSONField(required=True)
@@ -23,3 +45,57 @@ class EventSerializer(serializers.Serializer):
     )
     timestamp = serializers.DateTimeField(required=False)
     notify_user = serializers.BooleanField(required=False)
+    idempotency_key = serializers.CharField(
+        required=False, allow_null=True, max_length=255
+    )
+    # -- broadcast only: "all" or one of
+    # {"users": [...]}, {"groups": [...]}, {"roles": [...]} --
+    recipients = serializers.JSONField(required=False)
+    # -- notify_user only: send to one device or class of
+    # devices of the user instead of every connection --
+    device = serializers.RegexField(ID_PATTERN, required=False)
+    device_class = serializers.RegexField(ID_PATTERN, required=False)
+
+    def validate_recipients(self, value):
+        if value == "all":
+            return value
+
+        if (
+            not isinstance(value, dict)
+            or len(value) != 1
+            or next(iter(value)) not in self.RECIPIENT_TYPES
+        ):
+            raise serializers.ValidationError(
+                'Must be "all" or an object with one of the keys users, groups or roles.'
+            )
+
+        kind, recipients = next(iter(value.items()))
+        if not isinstance(recipients, list) or not recipients:
+            raise serializers.ValidationError("Must be a non-empty list.")
+
+        if kind == "users":
+            field = serializers.UUIDField()
+            recipients = [str(field.to_internal_value(user)) for user in recipients]
+        return {kind: recipients}
+
+    def validate(self, attrs):
+        if attrs.get("action") == "broadcast" and not attrs.get("recipients"):
+            raise serializers.ValidationError(
+                {"recipients": ["This field is required for a broadcast."]}
+            )
+        return attrs
+
+    def get_body(self):
+        """the event as published with the normalized recipients,
+        stored as the event log body and sent to the action task"""
+        body = self.initial_data.copy()
+        if "recipients" in self.validated_data:
+            body["recipients"] = self.validated_data["recipients"]
+        return body
+
+
+class BatchEventSerializer(EventSerializer):
+    """validates a single event in a batch, users are
+    looked up in bulk by the batch publisher"""
+
+    user = serializers.UUIDField(required=True)
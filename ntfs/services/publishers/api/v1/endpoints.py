@@ -1,5 +1,29 @@
 from services.publishers.api.common.base_pubblisher import BaseEventPublisherView
+from services.publishers.api.common.base_batch_publisher import (
+    BaseBatchEventPublisherView,
+)
+from services.publishers.api.common.async_publisher import BaseAsyncEventPublisherView
+from services.publishers.api.common.base_stream_publisher import (
+    BaseStreamEventPublisherView,
+)
+from services.publishers.api.common.base_event_logs import BaseRetryingEventListView
 
 
 class EventPublisher(BaseEventPublisherView):
     pass
+
+
+class EventBatchPublisher(BaseBatchEventPublisherView):
+    pass
+
+
+class AsyncEventPublisher(BaseAsyncEventPublisherView):
+    pass
+
+
+class EventStreamPublisher(BaseStreamEventPublisherView):
+    pass
+
+
+class RetryingEventList(BaseRetryingEventListView):
+    pass
@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 """payment service api url mappings"""
 from django.urls import path
-from .endpoints import EventPublisher
+from .endpoints import (
+    EventPublisher,
+    EventBatchPublisher,
+    AsyncEventPublisher,
+    EventStreamPublisher,
+    RetryingEventList,
+)
 
 app_name = "publisher:v1"
 
 urlpatterns = [
     path("publish/", EventPublisher.as_view(), name="event-publisher"),
+    path(
+        "publish/batch/", EventBatchPublisher.as_view(), name="event-batch-publisher"
+    ),
+    path(
+        "publish/async/", AsyncEventPublisher.as_view(), name="async-event-publisher"
+    ),
+    path(
+        "publish/stream/",
+        EventStreamPublisher.as_view(),
+        name="event-stream-publisher",
+    ),
+    path("events/retrying/", RetryingEventList.as_view(), name="retrying-events"),
 ]
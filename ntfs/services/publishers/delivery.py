@@ -0,0 +1,212 @@
+"""delivery backends for websocket notifications
+
+tasks hand notifications for websocket groups to the configured
+NOTIFICATION_DELIVERY backend:
+
+- ``rabbitmq`` (default) publishes to the channels_rabbitmq ``groups``
+  exchange, the ASGI servers consume it through their channel layer.
+- ``unix`` is for single host deployments, the notifications of a
+  task are packed together in msgpack datagrams of up to MAX_DATAGRAM
+  bytes sent to a unix socket of every ASGI process on the host, each
+  process hands them to its own (in-memory) channel layer, no broker
+  involved.
+
+both are at-most-once, like the channel layer: a notification that
+can't be delivered within SEND_TIMEOUT_MS is dropped (with the rest
+of the task's notifications to that process) and counted in ``stats``.
+"""
+import asyncio
+import atexit
+import collections
+import contextlib
+import logging
+import os
+import socket
+
+import msgpack
+from celery import current_app
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DELIVERY = getattr(settings, "NOTIFICATION_DELIVERY", {})
+BACKEND = DELIVERY.get("BACKEND", "rabbitmq")
+SOCKET_DIR = DELIVERY.get("SOCKET_DIR", "/tmp/ntfs-delivery")
+SEND_TIMEOUT = DELIVERY.get("SEND_TIMEOUT_MS", 100) / 1000
+MAX_DATAGRAM = DELIVERY.get("MAX_DATAGRAM", 16 * 1024)
+SOCKET_SUFFIX = ".sock"
+
+# -- delivered datagrams and dropped notifications of this process --
+stats = collections.Counter()
+
+
+class RabbitMQSender:
+    def __init__(self, producer):
+        self.producer = producer
+
+    def send(self, group, message):
+        self.producer.publish(
+            msgpack.packb({"__asgi_group__": group, **message}),
+            exchange="groups",  # The RabbitMQ exchange for websocket groups
+            content_encoding="binary",
+            routing_key=group,  # The group that will receive the message
+            retry=False,  # Channel Layer at-most-once semantics
+        )
+
+
+class RabbitMQDelivery:
+    """publishes to the channel layer's groups exchange"""
+
+    @contextlib.contextmanager
+    def sender(self):
+        with current_app.producer_pool.acquire(block=True) as producer:
+            yield RabbitMQSender(producer)
+
+
+class UnixSocketSender:
+    """buffers notifications and sends them to every process in
+    as few datagrams as possible, when the next one would go over
+    max_size and when the sender is flushed"""
+
+    def __init__(self, sock, addresses, max_size=MAX_DATAGRAM):
+        self.sock = sock
+        self.addresses = addresses
+        self.max_size = max_size
+        self.buffer = []
+        self.size = 0
+        self.full = set()
+
+    def send(self, group, message):
+        data = msgpack.packb({"group": group, "message": message})
+        if self.buffer and self.size + len(data) > self.max_size:
+            self.flush()
+        self.buffer.append(data)
+        self.size += len(data)
+
+    def flush(self):
+        if not self.buffer:
+            return
+
+        count = len(self.buffer)
+        # -- a msgpack array of the packed notifications --
+        data = msgpack.Packer().pack_array_header(count) + b"".join(self.buffer)
+        self.buffer, self.size = [], 0
+
+        for address in list(self.addresses):
+            # -- a process that didn't make room once is
+            # skipped for the rest of the task --
+            if address in self.full:
+                stats["messages_dropped"] += count
+                continue
+
+            try:
+                self.sock.sendto(data, address)
+                stats["datagrams_sent"] += 1
+            except (ConnectionRefusedError, FileNotFoundError):
+                # -- the process is gone, forget its socket --
+                self.addresses.remove(address)
+                with contextlib.suppress(OSError):
+                    os.unlink(address)
+            except socket.timeout:
+                self.full.add(address)
+                stats["messages_dropped"] += count
+                logger.warning(
+                    f"delivery socket {address} is full, dropped {count} "
+                    f"notifications ({stats['messages_dropped']} so far)"
+                )
+            except OSError as error:
+                stats["messages_dropped"] += count
+                logger.warning(f"delivery of {count} notifications to {address} failed: {error}")
+
+
+class UnixSocketDelivery:
+    """sends datagrams to every ASGI process listening in socket_dir"""
+
+    def __init__(self, socket_dir=SOCKET_DIR, timeout=SEND_TIMEOUT):
+        self.socket_dir = socket_dir
+        self.timeout = timeout
+
+    def get_addresses(self):
+        try:
+            names = os.listdir(self.socket_dir)
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self.socket_dir, name)
+            for name in names
+            if name.endswith(SOCKET_SUFFIX)
+        ]
+
+    @contextlib.contextmanager
+    def sender(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # -- a full socket gets timeout seconds to make room --
+        sock.settimeout(self.timeout)
+        sender = UnixSocketSender(sock, self.get_addresses())
+        try:
+            yield sender
+        finally:
+            sender.flush()
+            sock.close()
+
+
+BACKENDS = {
+    "rabbitmq": RabbitMQDelivery,
+    "unix": UnixSocketDelivery,
+}
+
+
+def get_backend(name=BACKEND):
+    return BACKENDS[name]()
+
+
+backend = get_backend()
+
+
+class DeliveryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+
+    def datagram_received(self, data, addr):
+        try:
+            deliveries = [
+                (delivery["group"], delivery["message"])
+                for delivery in msgpack.unpackb(data)
+            ]
+        except Exception as error:
+            logger.warning(f"dropping malformed delivery datagram: {error}")
+            return
+
+        for group, message in deliveries:
+            asyncio.ensure_future(self.channel_layer.group_send(group, message))
+
+
+_listener = None
+
+
+async def start_listener(channel_layer, socket_dir=SOCKET_DIR):
+    """binds this process's delivery socket, once per process,
+    datagrams received on it are group_send to channel_layer"""
+    global _listener
+    if BACKEND != "unix" or _listener is not None:
+        return
+
+    # -- any local user able to write here could inject notifications --
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    os.chmod(socket_dir, 0o700)
+    path = os.path.join(socket_dir, f"{os.getpid()}{SOCKET_SUFFIX}")
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+    loop = asyncio.get_running_loop()
+    _listener, _ = await loop.create_datagram_endpoint(
+        lambda: DeliveryProtocol(channel_layer),
+        local_addr=path,
+        family=socket.AF_UNIX,
+    )
+    atexit.register(remove_socket, path)
+
+
+def remove_socket(path):
+    with contextlib.suppress(OSError):
+        os.unlink(path)
@@ -1,3 +1,4 @@
 from .email import send_email
 from .sms import send_sms
 from .base import notify_user_task
+from .fanout import broadcast
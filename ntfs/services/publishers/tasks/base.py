@@ -2,40 +2,70 @@ from config.celery import app
 from celery.utils.log import get_task_logger
 from core.models import EventLog
 import traceback
+import datetime
 from core.models import UserNotification
-import msgpack
-from celery import current_app
+from celery.exceptions import Retry
+from django.utils import timezone
+from services.publishers import delivery
+from services.subscribers import presence
+from services.subscribers.sessions import get_group_name
+from . import status_writer
 
 
 logger = get_task_logger(__name__)
 
 
-def notify_user(user_id, payload, save_notification=False):
+def publish_notifications(sender, notifications, device=None, device_class=None):
+    """publishes (user_id, payload, cursor) notifications
+    to the users' websocket groups
+
+    every message goes through the given delivery sender (see
+    services.publishers.delivery), so a batch is published without
+    opening a connection per user. The cursor of a saved notification
+    lets the client resume from it when it reconnects, it is None for
+    unsaved notifications.
+
+    with a device or device_class only the matching connections
+    of each user get the notification.
+    """
+    for user_id, payload, cursor in notifications:
+        message = {"type": "send_notification", "data": payload}
+        if cursor is not None:
+            message["cursor"] = cursor
+
+        sender.send(get_group_name(user_id, device, device_class), message)
+
+
+def notify_user(
+    user_id, payload, save_notification=False, device=None, device_class=None
+):
+    """notifies every connection of the user, or only the
+    connections of one device or class of devices"""
+    cursor = None
     try:
         if save_notification:
-            UserNotification.objects.create(user=user_id, body=payload)
+            notification = UserNotification.objects.create(
+                user_id=user_id, body=payload
+            )
+            cursor = notification.cursor
     except Exception as error:
         logger.exception(f"Error in notify_user: {error}")
         return f"Error: {error}"
 
+    # -- nobody would receive it, a saved notification
+    # is replayed when the user reconnects --
+    if not presence.is_online(user_id):
+        logger.debug(f"User {user_id} is offline, not publishing")
+        return "User offline, notification not sent"
+
     try:
         logger.debug(f"Starting notify_user for user {user_id} with action")
-        channel = f"{user_id}_group"
-        logger.debug(f"Sending message to channel: {channel}")
-        data = {"type": "send_notification", "data": payload}
+        group_name = get_group_name(user_id, device, device_class)
+        logger.debug(f"Sending message to channel: {group_name}")
 
-        with current_app.producer_pool.acquire(block=True) as producer:
-            producer.publish(
-                msgpack.packb(
-                    {
-                        "__asgi_group__": channel,
-                        **data,
-                    }
-                ),
-                exchange="groups",  # The RabbitMQ exchange for websocket groups
-                content_encoding="binary",
-                routing_key=channel,  # The group that will receive the message
-                retry=False,  # Channel Layer at-most-once semantics
+        with delivery.backend.sender() as sender:
+            publish_notifications(
+                sender, [(user_id, payload, cursor)], device, device_class
             )
 
         logger.debug("Notification sent successfully")
@@ -51,17 +81,85 @@ class BaseEventTask(app.Task):
     max_retries = 3  # max retries before failure
     logger = logger
 
-    def update_event_status(self, event_id, status, message=None):
+    def update_event_status(self, event_id, status, message=None, next_retry_at=None):
         """
         Update the event log with the current status of the task.
+
+        Runs a single conditional UPDATE that only touches the status
+        columns, events that already reached a final status are left
+        alone so a late retry can't overwrite them. The attempt count
+        comes from the task request, next_retry_at is only kept while
+        the event is in RETRY.
+
+        With EVENTLOG_WRITE_BEHIND enabled the transition is buffered
+        and written in bulk by the status writer instead.
         """
-        try:
-            event = EventLog.objects.get(id=event_id)
-            event.status = status
-            event.message = message
-            event.save()
-        except EventLog.DoesNotExist:
-            self.logger.error(f"Event with ID {event_id} not found")
+        attempts = self.request.retries + 1
+
+        if status_writer.ENABLED:
+            status_writer.writer.write(
+                event_id, status, message, attempts, next_retry_at
+            )
+            return
+
+        updated = EventLog.objects.filter(
+            id=event_id, status__in=EventLog.ACTIVE_STATUSES
+        ).update(
+            status=status,
+            message=message or "",
+            attempts=attempts,
+            next_retry_at=next_retry_at,
+            updated_at=timezone.now(),
+        )
+
+        if not updated:
+            self.logger.warning(
+                f"Event with ID {event_id} not found or already finished"
+            )
+
+    def get_next_retry_at(self, einfo):
+        """returns when the retry is scheduled, from the Retry exception"""
+        retry = einfo.exception
+        if not isinstance(retry, Retry):
+            # -- the exception info may wrap the Retry --
+            retry = getattr(retry, "exc", None)
+
+        when = getattr(retry, "when", None)
+        if isinstance(when, (int, float)):
+            return timezone.now() + datetime.timedelta(seconds=when)
+        if isinstance(when, datetime.datetime):
+            return when
+        return None
+
+    def before_start(self, task_id, args, kwargs):
+        """
+        Move a retried event back to STARTED, the first attempt
+        doesn't write anything since the event is created as STARTED.
+        """
+        retries = self.request.retries
+        if retries:
+            self.update_event_status(
+                str(args[1]), "STARTED", f"retry attempt {retries} started"
+            )
+
+        super().before_start(task_id, args, kwargs)
+
+    def on_retry(self, exc, task_id, args, kwargs, einfo):
+        """
+        Record the retry on the event with the time it's scheduled for.
+        """
+        exc_type = type(exc).__name__
+        self.logger.info(
+            f"Retrying task {task_id}, attempt {self.request.retries + 1}"
+        )
+        self.update_event_status(
+            str(args[1]),
+            "RETRY",
+            f"{exc_type}: {exc}",
+            next_retry_at=self.get_next_retry_at(einfo),
+        )
+
+        super().on_retry(exc, task_id, args, kwargs, einfo)
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         """
@@ -104,6 +202,13 @@ class BaseEventTask(app.Task):
 
         super().on_failure(exc, task_id, args, kwargs, einfo)
 
+    def get_success_message(self, retval, message):
+        """
+        Returns the message stored on the event when the task succeeds,
+        subclasses can add details from the task result.
+        """
+        return message
+
     def on_success(self, retval, task_id, args, kwargs):
         """
         Handle task success, including updating the event status and notifying the user.
@@ -114,7 +219,9 @@ class BaseEventTask(app.Task):
         notification = args[2]
         notify_on_success = notification.get("notify_on_success", False)
         save_notification = notification.get("save_notification", False)
-        success_message = notification.get("success_message", "event completed")
+        success_message = self.get_success_message(
+            retval, notification.get("success_message", "event completed")
+        )
         self.logger.info(f"user id: {user_id}")
         self.logger.info(f"notify: {notify_on_success}")
 
@@ -146,4 +253,10 @@ def notify_user_task(self, payload, event_id, notification: dict):
     message = payload.get("payload", {})
     user = payload.get("user", "")
     save_notification = notification.get("save_notification", True)
-    notify_user(user, message, save_notification)
+    notify_user(
+        user,
+        message,
+        save_notification,
+        device=payload.get("device"),
+        device_class=payload.get("device_class"),
+    )
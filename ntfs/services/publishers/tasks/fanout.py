@@ -0,0 +1,118 @@
+"""broadcast action, notifies many users with a single event
+
+recipients are expanded server-side from the event's ``recipients``
+("all", users, groups or roles), streamed from the database in chunks
+of PUBLISHER_BROADCAST_CHUNK_SIZE and published to the channel layer
+through one delivery sender, recipients without a live connection (see
+services.subscribers.presence) are skipped. The event log of the broadcast is the only one
+written, it ends up with the aggregate counts in its message.
+"""
+from itertools import islice
+
+from django.conf import settings
+
+from config.celery import app
+from core.models import User, UserNotification
+from services.publishers import delivery
+from services.subscribers import presence
+from .base import BaseEventTask, publish_notifications
+
+CHUNK_SIZE = getattr(settings, "PUBLISHER_BROADCAST_CHUNK_SIZE", 2000)
+
+RECIPIENT_FILTERS = {
+    "users": "user_id__in",
+    "groups": "groups__name__in",
+    "roles": "roles__name__in",
+}
+
+
+def get_recipients(recipients, chunk_size=CHUNK_SIZE):
+    """yields the ids of the active users a broadcast goes to"""
+    queryset = User.objects.filter(is_active=True)
+    if recipients != "all":
+        kind, values = next(iter(recipients.items()))
+        queryset = queryset.filter(**{RECIPIENT_FILTERS[kind]: values})
+
+    return (
+        queryset.order_by()
+        .values_list("user_id", flat=True)
+        .distinct()
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def iter_chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+class BroadcastTask(BaseEventTask):
+    # -- retrying would deliver the broadcast twice
+    # to the recipients it already reached --
+    autoretry_for = ()
+
+    def get_success_message(self, retval, message):
+        return (
+            f"{message}: delivered to {retval['delivered']} of "
+            f"{retval['recipients']} recipients, {retval['offline']} offline, "
+            f"{retval['failed']} failed"
+        )
+
+
+@app.task(bind=True, base=BroadcastTask)
+def broadcast(self, payload, event_id, notification):
+    """Publish the payload to every recipient of the broadcast.
+
+    Args:
+        payload (dict): the event body, with the recipients.
+        event_id (string): The associated event ID.
+        notification (dict): Notification details (if needed for logging).
+
+    Returns:
+        dict: recipients, delivered and failed counts
+    """
+    message = payload.get("payload", {})
+    save_notification = notification.get("save_notification", False)
+    chunk_size = CHUNK_SIZE
+    counts = {"recipients": 0, "delivered": 0, "offline": 0, "failed": 0}
+
+    with delivery.backend.sender() as sender:
+        for user_ids in iter_chunks(
+            get_recipients(payload["recipients"], chunk_size), chunk_size
+        ):
+            counts["recipients"] += len(user_ids)
+            try:
+                notifications = [(user_id, message, None) for user_id in user_ids]
+                if save_notification:
+                    saved = UserNotification.objects.bulk_create(
+                        [
+                            UserNotification(user_id=user_id, body=message)
+                            for user_id in user_ids
+                        ]
+                    )
+                    # -- ids are only set on backends that return them --
+                    notifications = [
+                        (notification.user_id, message, notification.cursor)
+                        if notification.id is not None
+                        else (notification.user_id, message, None)
+                        for notification in saved
+                    ]
+                # -- one pipelined presence check per chunk --
+                online = presence.get_online(user_ids)
+                notifications = [
+                    notification
+                    for notification in notifications
+                    if notification[0] in online
+                ]
+                publish_notifications(sender, notifications)
+            except Exception as error:
+                # -- keep going, the rest of the recipients
+                # can still be reached --
+                self.logger.exception(f"broadcast {event_id} chunk failed: {error}")
+                counts["failed"] += len(user_ids)
+            else:
+                counts["delivered"] += len(notifications)
+                counts["offline"] += len(user_ids) - len(notifications)
+
+    return counts
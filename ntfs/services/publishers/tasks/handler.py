@@ -1,11 +1,16 @@
 # app/event_handler.py
-from services.publishers.tasks import notify_user_task, send_email, send_sms
+from services.publishers.tasks import notify_user_task, send_email, send_sms, broadcast
 from core.models import EventLog
 from celery.utils.log import get_task_logger
+from django.conf import settings
 
 logger = get_task_logger(__name__)
 from config.celery import app
 
+# -- when True events go through handle_event first,
+# which re-reads the event log before queuing the action --
+TWO_HOP_DISPATCH = getattr(settings, "PUBLISHER_TWO_HOP_DISPATCH", False)
+
 
 @app.task(max_retries=5, default_retry_delay=30)
 def handle_event(event_id):
@@ -16,6 +21,18 @@ def handle_event(event_id):
     factory.perform_action()
 
 
+@app.task(max_retries=5, default_retry_delay=30)
+def handle_events(event_ids):
+    """handles a batch of events published together,
+    loads all of them with a single query"""
+    events = EventLog.objects.filter(id__in=event_ids).select_related("user")
+
+    with app.producer_or_acquire() as producer:
+        for event in events:
+            factory = EventFactory(event)
+            factory.perform_action(producer=producer)
+
+
 class EventFactory:
     _event: EventLog = None
     action: str = ""
@@ -28,7 +45,8 @@ class EventFactory:
     ACTIONS = {
         "notify_user": notify_user_task,
         "send_mail": send_email,
-        "send_sms": send_sms
+        "send_sms": send_sms,
+        "broadcast": broadcast,
     }
 
     def __init__(self, event: EventLog):
@@ -43,8 +61,38 @@ class EventFactory:
         logger.debug("loading action...")
         return self.ACTIONS[action]
 
-    def perform_action(self):
+    def perform_action(self, producer=None):
         print("performing action...")
         action = self.load_action(self.action)
         notification = self._event.body.get("notification", {})
-        action.delay(self.payload, self._event.id, notification)
+        action.apply_async(
+            args=[self.payload, self._event.id, notification], producer=producer
+        )
+
+
+def dispatch_event(event_id, body, producer=None, two_hop=None):
+    """queues the action task of an event
+
+    the action is resolved from the event body here, so the task
+    gets the body directly without handle_event reading it back.
+    """
+    two_hop = TWO_HOP_DISPATCH if two_hop is None else two_hop
+    if two_hop:
+        return handle_event.apply_async(args=[event_id], producer=producer)
+
+    action = EventFactory.ACTIONS[body.get("action", "")]
+    notification = body.get("notification") or {}
+    return action.apply_async(args=[body, event_id, notification], producer=producer)
+
+
+def dispatch_events(events, two_hop=None):
+    """queues a batch of (event_id, body) pairs"""
+    two_hop = TWO_HOP_DISPATCH if two_hop is None else two_hop
+    if two_hop:
+        # -- one message for the whole batch --
+        return handle_events.apply_async(args=[[event_id for event_id, _ in events]])
+
+    # -- all messages go through one producer --
+    with app.producer_or_acquire() as producer:
+        for event_id, body in events:
+            dispatch_event(event_id, body, producer=producer, two_hop=False)
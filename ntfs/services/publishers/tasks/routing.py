@@ -0,0 +1,42 @@
+"""routes publisher tasks to one queue per action
+
+every action in EventFactory.ACTIONS gets its own queue named after
+the action, handle_event/handle_events share the ``events`` queue, so
+a slow provider only backs up its own queue.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+
+EVENTS_QUEUE = "events"
+
+DEFAULT_POOL = {"pool": "prefork", "concurrency": 2}
+
+
+@lru_cache(maxsize=None)
+def get_task_queues():
+    """returns a {task name: queue} dict"""
+    from .handler import EventFactory, handle_event, handle_events
+
+    queues = {task.name: action for action, task in EventFactory.ACTIONS.items()}
+    queues[handle_event.name] = EVENTS_QUEUE
+    queues[handle_events.name] = EVENTS_QUEUE
+    return queues
+
+
+def get_queues():
+    return sorted(set(get_task_queues().values()))
+
+
+def get_pool(queue):
+    """returns the worker pool settings of a queue"""
+    pools = getattr(settings, "PUBLISHER_WORKER_POOLS", {})
+    return {**DEFAULT_POOL, **pools.get(queue, {})}
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """celery router, see CELERY_TASK_ROUTES"""
+    queue = get_task_queues().get(name)
+    if queue is not None:
+        return {"queue": queue}
+    return None
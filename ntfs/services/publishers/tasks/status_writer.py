@@ -0,0 +1,172 @@
+"""write-behind writer for event status transitions
+
+when EVENTLOG_WRITE_BEHIND["ENABLED"] is set, tasks don't write their
+status to the database on success/failure, the transition is buffered
+in the worker process and a background thread writes the buffer every
+FLUSH_INTERVAL_MS (or as soon as MAX_BATCH transitions are waiting)
+with a single ``UPDATE ... FROM (VALUES ...)`` statement.
+
+the buffer is flushed again when the worker (or pool process) shuts
+down, rows that fail to flush are kept and written on the next flush,
+so every transition is written at least once.
+"""
+import atexit
+import os
+import threading
+
+from celery.signals import worker_process_shutdown, worker_shutdown
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from core.models import EventLog
+
+logger = get_task_logger(__name__)
+
+WRITE_BEHIND = getattr(settings, "EVENTLOG_WRITE_BEHIND", {})
+ENABLED = WRITE_BEHIND.get("ENABLED", False)
+FLUSH_INTERVAL = WRITE_BEHIND.get("FLUSH_INTERVAL_MS", 200) / 1000
+MAX_BATCH = WRITE_BEHIND.get("MAX_BATCH", 500)
+
+
+class StatusWriter:
+    """buffers status transitions and writes them in bulk
+
+    Methods
+    -------
+        write: buffers a transition
+        flush: writes every buffered transition
+    """
+
+    COLUMNS = ("status", "message", "attempts", "next_retry_at", "updated_at")
+
+    def __init__(self, interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        self.interval = interval
+        self.max_batch = max_batch
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def write(self, event_id, status, message="", attempts=0, next_retry_at=None):
+        event_id = str(event_id)
+        row = (status, message or "", attempts, next_retry_at, timezone.now())
+
+        with self._lock:
+            self.merge(event_id, row)
+            size = len(self._pending)
+
+        self.start()
+        if size >= self.max_batch:
+            self._wakeup.set()
+
+    def merge(self, event_id, row, newer=True):
+        """buffers row unless the pending transition wins, call with the lock
+
+        a final status wins over an active one, between two active
+        statuses the newer wins and between two final ones the first,
+        like in the database where only active rows are updated.
+        """
+        current = self._pending.get(event_id)
+        if current is None:
+            self._pending[event_id] = row
+            return
+
+        row_final = row[0] not in EventLog.ACTIVE_STATUSES
+        current_final = current[0] not in EventLog.ACTIVE_STATUSES
+        if row_final != current_final:
+            replace = row_final
+        elif row_final:
+            replace = not newer
+        else:
+            replace = newer
+
+        if replace:
+            self._pending[event_id] = row
+
+    def start(self):
+        # -- threads don't survive a fork, prefork pool
+        # processes each start their own --
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self.run, name="eventlog-status-writer", daemon=True
+                )
+                self._thread.start()
+
+    def run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            close_old_connections()
+            self.flush()
+
+    def flush(self):
+        """writes every buffered transition, returns the number of rows"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        if not pending:
+            return 0
+
+        rows = [(event_id, *row) for event_id, row in pending.items()]
+        try:
+            for start in range(0, len(rows), self.max_batch):
+                self.write_rows(rows[start : start + self.max_batch])
+        except Exception as error:
+            logger.exception(f"failed to flush event statuses: {error}")
+
+            # -- keep them for the next flush, merged with
+            # the transitions buffered since --
+            with self._lock:
+                for event_id, row in pending.items():
+                    self.merge(event_id, row, newer=False)
+            return 0
+
+        return len(rows)
+
+    def write_rows(self, rows):
+        if connection.vendor != "postgresql":
+            with transaction.atomic():
+                for event_id, *values in rows:
+                    EventLog.objects.filter(
+                        id=event_id, status__in=EventLog.ACTIVE_STATUSES
+                    ).update(**dict(zip(self.COLUMNS, values)))
+            return
+
+        values = ", ".join(
+            ["(%s::uuid, %s, %s, %s::integer, %s::timestamptz, %s::timestamptz)"]
+            * len(rows)
+        )
+        active = ", ".join(["%s"] * len(EventLog.ACTIVE_STATUSES))
+        sql = f"""
+            UPDATE {EventLog._meta.db_table} AS e
+            SET status = v.status, message = v.message, attempts = v.attempts,
+                next_retry_at = v.next_retry_at, updated_at = v.updated_at
+            FROM (VALUES {values})
+                AS v (id, status, message, attempts, next_retry_at, updated_at)
+            WHERE e.id = v.id AND e.status IN ({active})
+        """
+        params = [value for row in rows for value in row]
+        params += list(EventLog.ACTIVE_STATUSES)
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+
+writer = StatusWriter()
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_on_shutdown(**kwargs):
+    writer.flush()
+
+
+atexit.register(writer.flush)
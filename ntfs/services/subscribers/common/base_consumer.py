@@ -1,6 +1,19 @@
 # app/consumers/base_consumer.py
+import asyncio
+import collections
+import logging
+from urllib.parse import parse_qs
+
+import msgpack
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from channels.exceptions import StopConsumer
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from core.models import UserNotification
+from services.publishers import delivery
+from services.subscribers import drain, metrics, presence, sessions
 
 # from aioredis import from_url as redis_from_url
 # import os
@@ -16,8 +29,55 @@ from services.exceptions import handle_error_response, exception_handler
 
 REDIS_URL = getvar("REDIS_URI")
 
+logger = logging.getLogger(__name__)
+
+# -- notifications missed while disconnected are replayed
+# from UserNotification when the client sends ?since=<cursor> --
+REPLAY_PAGE_SIZE = getattr(settings, "WS_REPLAY_PAGE_SIZE", 100)
+REPLAY_MAX_MESSAGES = getattr(settings, "WS_REPLAY_MAX_MESSAGES", 1000)
+
+# -- clients connecting with ?batch=1 get messages sent within
+# WS_BATCH_WINDOW_MS (or up to WS_BATCH_MAX) as one array frame --
+BATCH_WINDOW = getattr(settings, "WS_BATCH_WINDOW_MS", 20) / 1000
+BATCH_MAX = getattr(settings, "WS_BATCH_MAX", 50)
+BATCH_OPT_IN = ("1", "true")
+
+# -- messages wait in a bounded queue per connection, a writer task
+# sends them, see WS_SEND_QUEUE in settings --
+SEND_QUEUE = getattr(settings, "WS_SEND_QUEUE", {})
+QUEUE_SIZE = SEND_QUEUE.get("MAX_SIZE", 256)
+OVERFLOW_POLICY = SEND_QUEUE.get("OVERFLOW", "coalesce")
+OVERFLOW_POLICIES = ("drop_oldest", "coalesce", "disconnect")
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+# -- clients offering this subprotocol get binary msgpack frames
+# instead of JSON text, compression (permessage-deflate) is
+# negotiated by the ASGI server --
+MSGPACK_SUBPROTOCOL = "ntfs.msgpack"
+
+# -- sent to connections evicted by a newer connection of the same
+# device or over WS_SESSIONS MAX_PER_USER, see services.subscribers.sessions --
+SESSION_EVICTED_CLOSE_CODE = 4009
+
+if OVERFLOW_POLICY not in OVERFLOW_POLICIES:
+    raise ImproperlyConfigured(
+        f"WS_SEND_QUEUE OVERFLOW must be one of {', '.join(OVERFLOW_POLICIES)}"
+    )
+
 
 class BaseConsumer(AsyncJsonWebsocketConsumer):
+    batching = False
+    binary = False
+    batch_window = BATCH_WINDOW
+    batch_max = BATCH_MAX
+    queue_size = QUEUE_SIZE
+    overflow_policy = OVERFLOW_POLICY
+    _queue = None
+    _writer = None
+    _has_space = None
+    _heartbeat = None
+    device = None
+    device_class = None
 
     async def connect(self):
         """handles what happens when user connects
@@ -28,32 +88,302 @@ class BaseConsumer(AsyncJsonWebsocketConsumer):
         self.user = self.scope["user"]
         self.group_name = f"{self.user.id}_group"
 
+        # -- a draining node sends clients to the other nodes --
+        if drain.is_draining():
+            await self.close()
+            return
+
         if self.user.is_authenticated:
             try:
-                await self.channel_layer.group_add(self.group_name, self.channel_name)
-                await self.accept()
+                self.device = self.get_query_param("device")
+                self.device_class = self.get_query_param("class")
+                if not (
+                    sessions.is_valid_id(self.device)
+                    and sessions.is_valid_id(self.device_class)
+                ):
+                    await self.close()
+                    return
+
+                self.batching = self.get_query_param("batch") in BATCH_OPT_IN
+                self.binary = MSGPACK_SUBPROTOCOL in self.scope.get("subprotocols", [])
+
+                await delivery.start_listener(self.channel_layer)
+                await drain.start_listener(self.channel_layer)
+                drain.install_signal_handler()
+                for group_name in self.get_group_names():
+                    await self.channel_layer.group_add(group_name, self.channel_name)
+                await self.accept(MSGPACK_SUBPROTOCOL if self.binary else None)
+                self.start_writer()
+                await self.join_presence()
+                await self.join_sessions()
+                self.start_heartbeat()
+
+                # -- live messages wait in the channel layer
+                # until the replay is done --
+                since = self.get_query_param("since")
+                if since:
+                    await self.replay(since)
             except Exception as error:
                 response = exception_handler(error, "an error occurred")
                 return handle_error_response(response, error)
         else:
             await self.close()
 
+    def get_group_names(self):
+        """the user group and the groups of the device and
+        device class the client connected with"""
+        group_names = [self.group_name]
+        if self.device:
+            group_names.append(sessions.get_group_name(self.user.id, device=self.device))
+        if self.device_class:
+            group_names.append(
+                sessions.get_group_name(self.user.id, device_class=self.device_class)
+            )
+        return group_names
+
+    def get_query_param(self, name, default=None):
+        query = parse_qs(self.scope.get("query_string", b"").decode("utf-8"))
+        values = query.get(name)
+        return values[-1] if values else default
+
+    @database_sync_to_async
+    def get_notifications_after(self, cursor, limit):
+        return list(
+            UserNotification.objects.filter(user_id=self.user.id)
+            .after(cursor)
+            .only("id", "timestamp", "body")[:limit]
+        )
+
+    async def replay(self, cursor):
+        """sends the user's notifications saved after cursor, in pages,
+        then a replay_complete message with the last cursor sent
+
+        replayed notifications have the same shape as live ones with
+        ``replayed`` set, a notification can arrive both replayed and
+        live, clients drop the ones at or before their last cursor.
+        """
+        try:
+            UserNotification.parse_cursor(cursor)
+        except ValueError:
+            await self.put_message({"type": "replay_error", "error": "invalid cursor"})
+            return
+
+        sent, has_more = 0, True
+        while has_more and sent < REPLAY_MAX_MESSAGES:
+            limit = min(REPLAY_PAGE_SIZE, REPLAY_MAX_MESSAGES - sent)
+            page = await self.get_notifications_after(cursor, limit + 1)
+            has_more = len(page) > limit
+
+            for notification in page[:limit]:
+                await self.put_message(
+                    {
+                        "type": "send_notification",
+                        "data": notification.body,
+                        "cursor": notification.cursor,
+                        "replayed": True,
+                    }
+                )
+                cursor = notification.cursor
+                sent += 1
+
+        await self.put_message(
+            {
+                "type": "replay_complete",
+                "count": sent,
+                "cursor": cursor,
+                # -- more than WS_REPLAY_MAX_MESSAGES were missed,
+                # the client should resync from the REST api --
+                "truncated": has_more,
+            }
+        )
+
+    @property
+    def queue_depth(self):
+        return len(self._queue) if self._queue is not None else 0
+
+    def start_writer(self):
+        self._queue = collections.deque()
+        self._pending = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        self._coalesced = 0
+        self._writer = asyncio.ensure_future(self.write_loop())
+        metrics.consumers.add(self)
+
+    def stop_writer(self):
+        if self._writer is not None:
+            self._writer.cancel()
+        self._queue = None
+        # -- wakes up a replay waiting for room --
+        if self._has_space is not None:
+            self._has_space.set()
+        metrics.consumers.discard(self)
+
+    async def send_message(self, message):
+        """queues a message for the client
+
+        when the client doesn't keep up and the queue is full the
+        overflow policy applies: drop_oldest drops the oldest queued
+        message, coalesce drops it too and the client gets a
+        notification_summary with the number of dropped messages
+        before the next one, disconnect closes the connection.
+        """
+        if self._queue is None:
+            return
+
+        if len(self._queue) >= self.queue_size:
+            if self.overflow_policy == "disconnect":
+                metrics.incr("slow_consumer_disconnects")
+                self.stop_writer()
+                await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+                return
+
+            self._queue.popleft()
+            metrics.incr("messages_dropped")
+            if self.overflow_policy == "coalesce":
+                self._coalesced += 1
+                metrics.incr("messages_coalesced")
+
+        self._queue.append(message)
+        if len(self._queue) >= self.queue_size:
+            self._has_space.clear()
+        self._pending.set()
+
+    async def put_message(self, message):
+        """queues a message, waiting for room instead of overflowing,
+        used for replays which can wait for the client"""
+        while self._queue is not None and len(self._queue) >= self.queue_size:
+            await self._has_space.wait()
+        await self.send_message(message)
+
+    def take_messages(self):
+        count = self.batch_max if self.batching else 1
+        messages = [
+            self._queue.popleft() for _ in range(min(count, len(self._queue)))
+        ]
+        if self._coalesced:
+            messages.insert(
+                0, {"type": "notification_summary", "count": self._coalesced}
+            )
+            self._coalesced = 0
+
+        self._has_space.set()
+        return messages
+
+    async def send_frame(self, content):
+        if self.binary:
+            await self.send(bytes_data=msgpack.packb(content))
+        else:
+            await self.send_json(content)
+
+    async def write_loop(self):
+        """sends queued messages, one frame per message or one
+        array frame per batch for batching clients"""
+        while True:
+            await self._pending.wait()
+            if self.batching:
+                await asyncio.sleep(self.batch_window)
+
+            while self._queue:
+                messages = self.take_messages()
+                try:
+                    for frame in [messages] if self.batching else messages:
+                        await self.send_frame(frame)
+                except Exception:
+                    # -- the connection is gone, disconnect cleans up --
+                    self.stop_writer()
+                    return
+                metrics.incr("messages_sent", len(messages))
+
+            self._pending.clear()
+
+    async def join_presence(self):
+        """registers the connection in the presence registry"""
+        if not presence.ENABLED:
+            return
+
+        try:
+            await presence.touch(self.user.id, self.channel_name)
+        except Exception as error:
+            # -- the user counts as online when presence can't be checked --
+            logger.warning(f"presence registration failed: {error}")
+
+    async def join_sessions(self):
+        """registers the connection in the session registry
+        and closes the connections it evicts"""
+        if not sessions.ENABLED:
+            return
+
+        try:
+            evicted = await sessions.register(
+                self.user.id, self.channel_name, self.device, self.device_class
+            )
+        except Exception as error:
+            # -- no limit is enforced when the registry is unreachable --
+            logger.warning(f"session registration failed: {error}")
+            return
+
+        for channel_name in evicted:
+            metrics.incr("sessions_evicted")
+            await self.channel_layer.send(channel_name, {"type": "evict_session"})
+
+    def start_heartbeat(self):
+        """keeps the presence and session entries alive"""
+        if presence.ENABLED or sessions.ENABLED:
+            self._heartbeat = asyncio.ensure_future(self.heartbeat())
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(presence.HEARTBEAT_INTERVAL)
+            try:
+                if presence.ENABLED:
+                    await presence.touch(self.user.id, self.channel_name)
+                if sessions.ENABLED:
+                    await sessions.refresh(self.user.id)
+            except Exception as error:
+                logger.warning(f"presence heartbeat failed: {error}")
+
+    async def leave_presence(self):
+        if self._heartbeat is None:
+            return
+
+        self._heartbeat.cancel()
+        self._heartbeat = None
+        try:
+            if presence.ENABLED:
+                await presence.remove(self.user.id, self.channel_name)
+            if sessions.ENABLED:
+                await sessions.unregister(self.user.id, self.channel_name)
+        except Exception as error:
+            logger.warning(f"presence removal failed: {error}")
+
+    async def evict_session(self, event):
+        """closes a connection replaced by a newer one of the user"""
+        self.stop_writer()
+        await self.close(code=SESSION_EVICTED_CLOSE_CODE)
+
     async def disconnect(self, close_code):
+        self.stop_writer()
+        await self.leave_presence()
+
         # When a WebSocket client disconnects, you can perform any cleanup here,
-        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        for group_name in self.get_group_names():
+            await self.channel_layer.group_discard(group_name, self.channel_name)
         raise StopConsumer()
 
     async def send_exit_signal(self, event):
-        await self.close()
+        self.stop_writer()
+        await self.close(code=drain.DRAIN_CLOSE_CODE)
 
     # Broadcast exit signal to all consumers
-    async def shutdown_consumers(self):
-        await self.channel_layer.group_send(
-            self.group_name, {"type": "send_exit_signal"}
-        )
+    async def shutdown_consumers(self, window=drain.WINDOW, host=None):
+        """drains every node (or only host), see services.subscribers.drain"""
+        await drain.request_drain(self.channel_layer, window, host)
 
     async def receive(self, text_data=None, bytes_data=None, **kwargs):
         try:
+            if self.binary and bytes_data is not None:
+                return await self.receive_json(msgpack.unpackb(bytes_data), **kwargs)
             return await super().receive(text_data, bytes_data, **kwargs)
         except Exception as error:
             response = exception_handler(error, "an error occurred")
@@ -64,7 +394,7 @@ class BaseConsumer(AsyncJsonWebsocketConsumer):
 
     async def send_notification(self, message):
         try:
-            await self.send_json(message)
+            await self.send_message(message)
         except Exception as error:
             response = exception_handler(error, "an error occurred")
             return handle_error_response(response, error)
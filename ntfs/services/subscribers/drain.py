@@ -0,0 +1,155 @@
+"""graceful drain of the websocket connections of an ASGI process
+
+a drain is started by the ``drain_websockets`` management command,
+through the DRAIN_GROUP channel layer group (one channel per process
+joins it, see start_listener), or by sending the process the WS_DRAIN
+SIGNAL (SIGUSR1 by default).
+
+a draining process refuses new connections and sends every client a
+``reconnect`` message with a random delay within WINDOW seconds, then
+closes the connections still open in waves every WAVE_INTERVAL
+seconds, each client in the first wave after its delay, so clients
+reconnect to the other nodes spread over WINDOW instead of all at once.
+"""
+import asyncio
+import collections
+import logging
+import math
+import random
+import signal
+import socket
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DRAIN = getattr(settings, "WS_DRAIN", {})
+WINDOW = DRAIN.get("WINDOW", 60)
+WAVE_INTERVAL = DRAIN.get("WAVE_INTERVAL", 1)
+SIGNAL = DRAIN.get("SIGNAL", "SIGUSR1")
+DRAIN_GROUP = "websocket_drain"
+# -- group memberships expire in the channel layer (a day by default) --
+GROUP_REFRESH_INTERVAL = 3600
+
+# -- close code for "service restart", clients reconnect --
+DRAIN_CLOSE_CODE = 1012
+
+_drain = None
+_signal_installed = False
+_listener = None
+_channel = None
+_joined_at = 0
+
+
+def is_draining():
+    return _drain is not None
+
+
+def get_reconnect_delay(window=WINDOW):
+    """random delay in milliseconds the client should wait before reconnecting"""
+    return int(random.uniform(0, window) * 1000)
+
+
+def get_waves(consumers, interval=WAVE_INTERVAL):
+    """groups (delay_ms, consumer) pairs into (seconds, consumers) waves,
+    one every interval seconds, a consumer is closed in the first wave
+    at or after its delay so it never has to wait for a closed connection"""
+    waves = collections.defaultdict(list)
+    for delay, consumer in consumers:
+        seconds = delay / 1000
+        if interval:
+            seconds = math.ceil(seconds / interval) * interval
+        waves[seconds].append(consumer)
+    return sorted(waves.items(), key=lambda wave: wave[0])
+
+
+def start(window=WINDOW, host=None):
+    """starts draining this process, returns False if it
+    already is or the drain targets another host"""
+    global _drain
+    if _drain is not None or (host and host != socket.gethostname()):
+        return False
+
+    logger.info(f"draining websocket connections over {window}s")
+    _drain = asyncio.ensure_future(run(window))
+    return True
+
+
+async def run(window=WINDOW):
+    consumers = [
+        (get_reconnect_delay(window), consumer) for consumer in metrics.consumers
+    ]
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+
+    for delay, consumer in consumers:
+        try:
+            await consumer.send_message({"type": "reconnect", "delay_ms": delay})
+        except Exception as error:
+            logger.warning(f"reconnect hint failed: {error}")
+
+    for seconds, wave in get_waves(consumers, WAVE_INTERVAL):
+        await asyncio.sleep(max(0, started + seconds - loop.time()))
+        for consumer in wave:
+            # -- the client may have reconnected already --
+            if consumer in metrics.consumers:
+                metrics.incr("drained_connections")
+                await consumer.send_exit_signal({"type": "send_exit_signal"})
+
+    logger.info(f"drained {len(consumers)} websocket connections")
+
+
+def install_signal_handler():
+    """starts a drain when the process gets SIGNAL, once per process"""
+    global _signal_installed
+    if _signal_installed or not SIGNAL:
+        return
+
+    _signal_installed = True
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            getattr(signal, SIGNAL), start
+        )
+    except (NotImplementedError, RuntimeError, ValueError) as error:
+        # -- not in the main thread or not supported by the loop --
+        logger.warning(f"drain signal handler not installed: {error}")
+
+
+async def start_listener(channel_layer):
+    """joins DRAIN_GROUP with a channel of this process, once per
+    process, a drain request reaches each process once instead of
+    every consumer"""
+    global _listener, _channel, _joined_at
+    if _listener is not None and time.monotonic() - _joined_at < GROUP_REFRESH_INTERVAL:
+        return
+
+    if _listener is None:
+        _channel = await channel_layer.new_channel("drain.")
+        _listener = asyncio.ensure_future(listen(channel_layer, _channel))
+
+    _joined_at = time.monotonic()
+    await channel_layer.group_add(DRAIN_GROUP, _channel)
+
+
+async def listen(channel_layer, channel):
+    while True:
+        try:
+            message = await channel_layer.receive(channel)
+        except Exception as error:
+            logger.warning(f"drain listener failed: {error}")
+            await asyncio.sleep(1)
+            continue
+
+        if message.get("type") == "start_drain":
+            start(message.get("window", WINDOW), message.get("host"))
+
+
+async def request_drain(channel_layer, window=WINDOW, host=None):
+    """asks every process with connected consumers (or only the
+    ones on host) to drain"""
+    await channel_layer.group_send(
+        DRAIN_GROUP, {"type": "start_drain", "window": window, "host": host}
+    )
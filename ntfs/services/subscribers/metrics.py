@@ -0,0 +1,35 @@
+"""websocket metrics of the current ASGI process
+
+connected consumers register themselves in ``consumers`` while they
+have a send queue, counters are incremented with ``incr``. Served by
+the subscribers metrics endpoint.
+"""
+import os
+import weakref
+from collections import Counter
+
+from services.utils import cache
+
+consumers = weakref.WeakSet()
+counters = Counter()
+
+
+def incr(name, value=1):
+    counters[name] += value
+
+
+def snapshot():
+    depths = [consumer.queue_depth for consumer in list(consumers)]
+    return {
+        "pid": os.getpid(),
+        "connections": len(depths),
+        "queue_depth": sum(depths),
+        "max_queue_depth": max(depths, default=0),
+        "messages_sent": counters["messages_sent"],
+        "messages_dropped": counters["messages_dropped"],
+        "messages_coalesced": counters["messages_coalesced"],
+        "slow_consumer_disconnects": counters["slow_consumer_disconnects"],
+        "sessions_evicted": counters["sessions_evicted"],
+        "drained_connections": counters["drained_connections"],
+        "cache": cache.get_stats(),
+    }
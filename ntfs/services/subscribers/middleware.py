@@ -2,30 +2,47 @@ from django.contrib.auth.models import AnonymousUser
 from knox.models import AuthToken
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
-import hashlib
+from core.models import AuthTokenHash
+from rest_framework.exceptions import AuthenticationFailed
+from services.authservice.backends import CachedTokenAuthentication
+from services.authservice.backends.principal_cache import (
+    principal_cache,
+    tk_cache_key,
+    is_expired,
+)
 
 
 @database_sync_to_async
 def get_user(token_key, name):
     try:
         if name == "token":
-            token = AuthToken.objects.get(token_key=token_key)
-            return token.user
+            user, _ = CachedTokenAuthentication().authenticate_credentials(
+                token_key.encode("utf-8")
+            )
+            return user
 
         else:
-            tokens = AuthToken.objects.all()
-            if tokens:
-                for stored_token in tokens:
-                    tkk = stored_token.token_key
-                    stored_token_hash = hashlib.sha256(
-                        str(tkk).encode("utf-8")
-                    ).hexdigest()
+            # -- '?tk=' is the sha256 of the token key,
+            # looked up through the indexed AuthTokenHash --
+            key = tk_cache_key(token_key)
+            auth_token = principal_cache.get(key)
+            if auth_token is None:
+                token_hash = (
+                    AuthTokenHash.objects.select_related("auth_token__user")
+                    .filter(key_hash=token_key)
+                    .first()
+                )
+                if token_hash is None or is_expired(token_hash.auth_token):
+                    return AnonymousUser()
+
+                auth_token = token_hash.auth_token
+                principal_cache.set(key, auth_token)
 
-                    if token_key == stored_token_hash:
-                        token = AuthToken.objects.get(token_key=tkk)
-                        return token.user
+            if not auth_token.user.is_active:
+                return AnonymousUser()
+            return auth_token.user
 
-    except AuthToken.DoesNotExist:
+    except (AuthToken.DoesNotExist, AuthenticationFailed):
         return AnonymousUser()
 
 
@@ -42,7 +59,7 @@ class TokenAuthMiddleware(BaseMiddleware):
                     # -- Assuming the Authorization header is in the format "Bearer token" --
                     parts = value.decode().split()
                     if len(parts) == 2 and parts[0].lower() == "token":
-                        token_key, param_name = parts[1][:8], "token"
+                        token_key, param_name = parts[1], "token"
                     break
 
             if token_key is None:
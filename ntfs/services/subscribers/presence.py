@@ -0,0 +1,93 @@
+"""presence registry of connected websocket users
+
+every connection of a user is a member of the ``presence:<user id>``
+sorted set, scored with the time it expires at. Consumers add
+themselves on connect, refresh their score every HEARTBEAT_INTERVAL
+seconds and remove themselves on disconnect, members of a crashed
+node stop counting once their score is in the past and the whole key
+expires after TTL seconds without a heartbeat.
+
+tasks check presence before publishing to the channel layer, a user
+without a live member is offline.
+"""
+import logging
+import time
+from functools import lru_cache
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PRESENCE = getattr(settings, "PRESENCE", {})
+ENABLED = PRESENCE.get("ENABLED", False)
+TTL = PRESENCE.get("TTL", 90)
+HEARTBEAT_INTERVAL = PRESENCE.get("HEARTBEAT_INTERVAL", 30)
+KEY_PREFIX = "presence:"
+
+
+def get_redis_url():
+    return PRESENCE.get("REDIS_URL") or settings.CACHES["default"]["LOCATION"]
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    return redis.Redis.from_url(get_redis_url())
+
+
+@lru_cache(maxsize=None)
+def get_async_client():
+    return redis.asyncio.Redis.from_url(get_redis_url())
+
+
+def presence_key(user_id):
+    return f"{KEY_PREFIX}{user_id}"
+
+
+async def touch(user_id, channel_name):
+    """adds or refreshes a connection of the user"""
+    now = time.time()
+    key = presence_key(user_id)
+    async with get_async_client().pipeline(transaction=False) as pipe:
+        # -- members left behind by crashed nodes --
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zadd(key, {channel_name: now + TTL})
+        pipe.expire(key, TTL)
+        await pipe.execute()
+
+
+async def remove(user_id, channel_name):
+    await get_async_client().zrem(presence_key(user_id), channel_name)
+
+
+def is_online(user_id):
+    """True if the user has a live connection, or if presence
+    is disabled or can't be checked"""
+    if not ENABLED:
+        return True
+
+    try:
+        return get_client().zcount(presence_key(user_id), time.time(), "+inf") > 0
+    except redis.RedisError as error:
+        logger.warning(f"presence check failed, assuming online: {error}")
+        return True
+
+
+def get_online(user_ids):
+    """returns the users of user_ids with a live connection,
+    checked with one pipelined round trip"""
+    if not ENABLED:
+        return set(user_ids)
+
+    now = time.time()
+    try:
+        with get_client().pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(presence_key(user_id), now, "+inf")
+            counts = pipe.execute()
+    except redis.RedisError as error:
+        logger.warning(f"presence check failed, assuming online: {error}")
+        return set(user_ids)
+
+    return {user_id for user_id, count in zip(user_ids, counts) if count}
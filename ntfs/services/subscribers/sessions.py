@@ -0,0 +1,136 @@
+"""registry of the websocket connections of every user
+
+each connection of a user is a field of the ``sessions:<user id>``
+hash, keyed by channel name, with the device id and device class the
+client connected with (``?device=<id>&class=<class>``) and the time it
+connected. The hash expires TTL seconds after the last heartbeat of
+any of the user's connections.
+
+a user can keep at most MAX_PER_USER connections, when a new one
+goes over the limit the oldest are evicted. A device reconnecting
+with the same device id replaces its previous connection.
+
+connections also join a group per device and per device class next
+to the user group, so a notification can be sent to every connection
+of a user, to one device or to one class of devices.
+"""
+import json
+import logging
+import re
+import time
+
+import redis
+from django.conf import settings
+
+from . import presence
+
+logger = logging.getLogger(__name__)
+
+SESSIONS = getattr(settings, "WS_SESSIONS", {})
+ENABLED = SESSIONS.get("ENABLED", False)
+MAX_PER_USER = SESSIONS.get("MAX_PER_USER", 5)
+TTL = SESSIONS.get("TTL", presence.TTL)
+KEY_PREFIX = "sessions:"
+
+# -- device ids and classes end up in group names, which the channel
+# layer limits to ASCII alphanumerics, hyphens, underscores and periods
+# and to less than 100 characters: a 36 character user id, "_device_"
+# and the id must fit --
+ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,54}$")
+
+
+def is_valid_id(value):
+    return value is None or bool(ID_PATTERN.match(value))
+
+
+def sessions_key(user_id):
+    return f"{KEY_PREFIX}{user_id}"
+
+
+def get_group_name(user_id, device=None, device_class=None):
+    """returns the group of every connection of the user,
+    or of one of their devices or device classes"""
+    if device:
+        return f"{user_id}_device_{device}"
+    if device_class:
+        return f"{user_id}_class_{device_class}"
+    return f"{user_id}_group"
+
+
+def get_evicted(sessions, channel_name, device, max_per_user=MAX_PER_USER):
+    """returns the channels to evict for a new connection, connections of
+    the same device first and then the oldest ones over max_per_user"""
+    others = sorted(
+        (
+            (session["connected_at"], channel, session)
+            for channel, session in sessions.items()
+            if channel != channel_name
+        ),
+        key=lambda item: item[0],
+    )
+
+    evicted = [
+        channel for _, channel, session in others
+        if device and session.get("device") == device
+    ]
+    remaining = [channel for _, channel, _ in others if channel not in evicted]
+    if max_per_user:
+        # -- the new connection counts too --
+        over = len(remaining) + 1 - max_per_user
+        evicted += remaining[: max(over, 0)]
+    return evicted
+
+
+def decode(sessions):
+    return {
+        channel.decode() if isinstance(channel, bytes) else channel: json.loads(value)
+        for channel, value in sessions.items()
+    }
+
+
+async def register(user_id, channel_name, device=None, device_class=None):
+    """adds a connection of the user, returns the channel names
+    of the connections it evicts"""
+    key = sessions_key(user_id)
+    session = {
+        "device": device,
+        "device_class": device_class,
+        "connected_at": time.time(),
+    }
+
+    client = presence.get_async_client()
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.hset(key, channel_name, json.dumps(session))
+        pipe.expire(key, TTL)
+        pipe.hgetall(key)
+        *_, sessions = await pipe.execute()
+
+    evicted = get_evicted(decode(sessions), channel_name, device)
+    if evicted:
+        await client.hdel(key, *evicted)
+    return evicted
+
+
+async def refresh(user_id):
+    await presence.get_async_client().expire(sessions_key(user_id), TTL)
+
+
+async def unregister(user_id, channel_name):
+    await presence.get_async_client().hdel(sessions_key(user_id), channel_name)
+
+
+def get_sessions(user_id):
+    """returns the connections of the user, oldest first"""
+    if not ENABLED:
+        return []
+
+    try:
+        sessions = decode(presence.get_client().hgetall(sessions_key(user_id)))
+    except redis.RedisError as error:
+        logger.warning(f"session lookup failed: {error}")
+        return []
+
+    return sorted(
+        ({"channel": channel, **session} for channel, session in sessions.items()),
+        key=lambda session: session["connected_at"],
+    )
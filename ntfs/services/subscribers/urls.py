@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""subscribers url mappings"""
+from django.urls import path
+
+from .views import SubscriberMetricsView, UserSessionsView
+
+app_name = "subscribers"
+
+urlpatterns = [
+    path(
+        "v1/subscribers/metrics/",
+        SubscriberMetricsView.as_view(),
+        name="subscriber-metrics",
+    ),
+    path(
+        "v1/subscribers/users/<uuid:user_id>/sessions/",
+        UserSessionsView.as_view(),
+        name="user-sessions",
+    ),
+]
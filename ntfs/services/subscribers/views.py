@@ -0,0 +1,36 @@
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from services.utils.functions import format_response_data
+from . import metrics, sessions
+
+
+class SubscriberMetricsView(APIView):
+    """websocket connection, send queue and dropped message counts
+    and cache hits per tier of the ASGI process serving the request"""
+
+    http_method_names = ["get"]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(
+            format_response_data(metrics.snapshot(), 200), status=status.HTTP_200_OK
+        )
+
+
+class UserSessionsView(APIView):
+    """websocket connections of a user with their device
+    id, device class and connection time, oldest first"""
+
+    http_method_names = ["get"]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, user_id, *args, **kwargs):
+        user_sessions = sessions.get_sessions(user_id)
+        return Response(
+            format_response_data(
+                {"count": len(user_sessions), "sessions": user_sessions}, 200
+            ),
+            status=status.HTTP_200_OK,
+        )
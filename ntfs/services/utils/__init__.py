@@ -1 +1,2 @@
 from .cache import Cache
+from .lru import LRUCache
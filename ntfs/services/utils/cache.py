@@ -1,11 +1,55 @@
+from django.conf import settings
 from django.core.cache import caches, CacheKeyWarning
+import logging
+import math
+import random
+import threading
+import time
 import uuid
+from collections import Counter
 from typing import Any
-from redis.exceptions import ConnectionError
+from redis.exceptions import ConnectionError, TimeoutError
 from sentry_sdk import capture_exception
 
+from .circuit_breaker import CircuitBreaker
+from .codecs import get_codec
+from .invalidation import HEALTH_CHECK_INTERVAL, Invalidator
+from .lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
 # caches['fallback'].clear()
 
+# -- optional in-process (L1) cache in front of the default
+# cache (L2) for Cache instances created with local=True --
+CACHE_L1 = getattr(settings, "CACHE_L1", {})
+L1_ENABLED = CACHE_L1.get("ENABLED", False)
+L1_TTL = CACHE_L1.get("TTL", 30)
+L1_CHANNEL = CACHE_L1.get("CHANNEL", "cache_invalidation")
+
+local_cache = LRUCache(maxsize=CACHE_L1.get("MAXSIZE", 10000), ttl=L1_TTL)
+
+# -- hits and misses per tier of this process --
+stats = Counter()
+
+# -- get_or_set: how long a recompute lock is held at most and how
+# long other callers wait for it when there's no stale value --
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+# -- after FAILURE_THRESHOLD redis errors in a row calls go straight
+# to the fallback cache until a probe every PROBE_INTERVAL seconds
+# reaches redis again --
+CIRCUIT_BREAKER = getattr(settings, "CACHE_CIRCUIT_BREAKER", {})
+REDIS_ERRORS = (ConnectionError, TimeoutError)
+MAX_MISSED_KEYS = CIRCUIT_BREAKER.get("MAX_MISSED_KEYS", 100000)
+
+# -- cache methods that change keys, the keys are
+# their first argument (or its items) --
+KEY_WRITES = ("set", "add", "delete", "incr", "decr", "touch")
+MANY_KEYS_WRITES = ("set_many", "delete_many")
+
 
 def generate_uuid():
     return str(uuid.uuid4())
@@ -27,6 +71,218 @@ def generate_keys_cache_key(prefix, key):
     return f"{prefix}{key}_keys"
 
 
+# -- deletes every key of a family's set and the set itself,
+# UNLINK frees the values in the background --
+INVALIDATE_FAMILY_SCRIPT = """
+local keys = redis.call('SMEMBERS', KEYS[1])
+for i = 1, #keys, 500 do
+    redis.call('UNLINK', unpack(keys, i, math.min(i + 499, #keys)))
+end
+redis.call('DEL', KEYS[1])
+return #keys
+"""
+
+
+def get_stats():
+    return {
+        **{
+            tier: {"hits": stats[f"{tier}_hits"], "misses": stats[f"{tier}_misses"]}
+            for tier in ("l1", "l2")
+        },
+        "circuit_breaker": {**breaker.snapshot(), "missed_keys": len(missed_writes.keys)},
+    }
+
+
+def get_redis_client(cache):
+    """returns the redis client of a django RedisCache,
+    None for other backends (e.g. the local memory fallback)"""
+    backend = getattr(cache, "_cache", None)
+    if not hasattr(backend, "get_client"):
+        return None
+    return backend.get_client(write=True)
+
+
+def get_subscriber_client(cache):
+    """returns a redis client on the server of a django RedisCache
+    for pub/sub, the subscription idles between messages so it has no
+    socket timeout, health checks and keepalives find dead connections"""
+    backend = getattr(cache, "_cache", None)
+    if not hasattr(backend, "get_client"):
+        return None
+
+    options = {
+        **backend._pool_options,
+        "socket_timeout": None,
+        "socket_keepalive": True,
+        "health_check_interval": HEALTH_CHECK_INTERVAL,
+    }
+    pool = backend._pool_class.from_url(backend._servers[0], **options)
+    return backend._client(connection_pool=pool)
+
+
+def ping():
+    client = get_redis_client(caches["default"])
+    if client is not None:
+        client.ping()
+
+
+class MissedWrites:
+    """
+    Writes redis missed while they went to the fallback cache
+
+    keys set or deleted, families invalidated (by the key of their set)
+    and L1 invalidations that couldn't be published, redis still has
+    the values from before. At most maxsize keys are kept, the others
+    stay in redis until they expire.
+
+    Methods
+    -------
+        add: Record missed writes
+        take: Return and forget every recorded write
+    """
+
+    def __init__(self, maxsize=MAX_MISSED_KEYS):
+        self.maxsize = maxsize
+        self.keys = set()
+        self.families = set()
+        self.prefixes = set()
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.keys or self.families or self.prefixes)
+
+    def add(self, keys=(), families=(), prefixes=()):
+        with self._lock:
+            for key in keys:
+                if len(self.keys) >= self.maxsize:
+                    logger.warning(f"over {self.maxsize} keys missed by redis, not replayed")
+                    break
+                self.keys.add(key)
+            self.families.update(families)
+            self.prefixes.update(prefixes)
+
+    def take(self):
+        with self._lock:
+            missed = self.keys, self.families, self.prefixes
+            self.keys, self.families, self.prefixes = set(), set(), set()
+        return missed
+
+
+missed_writes = MissedWrites()
+
+
+def replay_missed_writes():
+    """drops what changed in the fallback cache from redis, raises
+    if redis fails and keeps the writes for the next attempt"""
+    if not missed_writes:
+        return
+
+    keys, families, prefixes = missed_writes.take()
+    cache = caches["default"]
+    try:
+        client = get_redis_client(cache)
+        if keys:
+            cache.delete_many(list(keys))
+        for keys_key in families:
+            if client is not None:
+                client.eval(INVALIDATE_FAMILY_SCRIPT, 1, cache.make_key(keys_key))
+        if L1_ENABLED and client is not None and (keys or prefixes):
+            invalidator.publish(list(keys), list(prefixes))
+    except Exception:
+        missed_writes.add(keys, families, prefixes)
+        raise
+
+    # -- the next outage starts from an empty fallback cache --
+    caches["fallback"].clear()
+    logger.info(
+        f"replayed {len(keys)} keys and {len(families)} families missed by redis"
+    )
+
+
+breaker = CircuitBreaker(
+    threshold=CIRCUIT_BREAKER.get("FAILURE_THRESHOLD", 3),
+    probe_interval=CIRCUIT_BREAKER.get("PROBE_INTERVAL", 5),
+    probe=ping,
+    on_close=replay_missed_writes,
+)
+
+
+def call_cache(method, *args, **kwargs):
+    """calls a method of the default cache, of the fallback
+    cache while the breaker is open or if redis fails"""
+    if breaker.allow():
+        try:
+            result = getattr(caches["default"], method)(*args, **kwargs)
+        except REDIS_ERRORS as error:
+            capture_exception(error)
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+            return result
+
+    if method in KEY_WRITES:
+        missed_writes.add(keys=[args[0]])
+    elif method in MANY_KEYS_WRITES:
+        missed_writes.add(keys=list(args[0]))
+    return getattr(caches["fallback"], method)(*args, **kwargs)
+
+
+def call_redis(operation, fallback, missed=None):
+    """runs operation(client) with the redis client of the default
+    cache, fallback(cache) with the default cache if it isn't redis or
+    with the fallback cache while the breaker is open or if redis fails,
+    missed (MissedWrites.add kwargs) is recorded in the latter case"""
+    if not breaker.allow():
+        missed_writes.add(**(missed or {}))
+        return fallback(caches["fallback"])
+
+    client = get_redis_client(caches["default"])
+    if client is None:
+        return fallback(caches["default"])
+
+    try:
+        result = operation(client)
+    except REDIS_ERRORS as error:
+        capture_exception(error)
+        breaker.record_failure()
+        missed_writes.add(**(missed or {}))
+        return fallback(caches["fallback"])
+
+    breaker.record_success()
+    return result
+
+
+def publish_invalidation(keys=(), prefixes=()):
+    """drops keys from the L1 of every process, only
+    this process's while redis can't be reached"""
+    if L1_ENABLED:
+        call_redis(
+            lambda client: invalidator.publish(keys, prefixes),
+            lambda cache: invalidator.apply(keys, prefixes),
+            missed={"keys": keys, "prefixes": prefixes},
+        )
+
+
+def track_key_in_list(cache, keys_key, key, timeout):
+    """keeps a family's keys in a list on caches without sets"""
+    keys = cache.get(keys_key) or []
+    if key not in keys:
+        cache.set(keys_key, [*keys, key], timeout)
+
+
+def invalidate_list(cache, keys_key):
+    keys = cache.get(keys_key) or []
+    cache.delete_many([*keys, keys_key])
+
+
+invalidator = Invalidator(
+    local_cache,
+    lambda: get_redis_client(caches["default"]),
+    L1_CHANNEL,
+    get_subscriber=lambda: get_subscriber_client(caches["default"]),
+)
+
+
 class Cache:
     """
     Cache class to handle cache operations
@@ -35,6 +291,14 @@ class Cache:
     ----------
         prefix (str): Prefix to be added to the cache key
         timeout (int): Time in seconds for the cache to expire
+        local (bool): Keep read-heavy keys in the in-process cache
+            too, when CACHE_L1 is enabled
+        stale_ttl (int): Time in seconds get_or_set keeps serving an
+            expired value while one caller recomputes it
+        beta (float): How early get_or_set recomputes a value before
+            it expires, 0 to only recompute expired values
+        codec (str): Name of the CACHE_CODECS codec values are stored
+            with, pickled by the cache backend if None
 
     Example
     -------
@@ -51,6 +315,7 @@ class Cache:
     -------
         get: Get the cached data for the given key
         set: Set the cached data for the given key
+        get_or_set: Get the cached data or compute it, once at a time
         invalidate_all: Invalidate all the cache keys
         invalidate: Invalidate the cache for the given key
         get_list: Get the cached data for the given key
@@ -58,9 +323,39 @@ class Cache:
         invalidate_list: Invalidate the cache for the given key
     """
 
-    def __init__(self, prefix="cached_", timeout=3600 * 48):
+    def __init__(
+        self,
+        prefix="cached_",
+        timeout=3600 * 48,
+        local=False,
+        stale_ttl=0,
+        beta=1.0,
+        codec=None,
+    ):
         self.prefix = prefix
         self.timeout = timeout
+        self.local = L1_ENABLED and local
+        self.stale_ttl = stale_ttl
+        self.beta = beta
+        self.codec = get_codec(codec)
+
+    def get_local(self, key):
+        """returns the L1 entry of key, None on a miss or while
+        the L1 can't be kept coherent"""
+        invalidator.start()
+        if not invalidator.is_connected():
+            return None
+
+        data = local_cache.get(key)
+        stats["l1_hits" if data is not None else "l1_misses"] += 1
+        return data
+
+    def set_local(self, key, data, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        if invalidator.is_connected():
+            local_cache.set(
+                key, data, L1_TTL if timeout is None else min(L1_TTL, timeout)
+            )
 
     def _generate_cache_key(self, key: str) -> str:
         """
@@ -113,10 +408,16 @@ class Cache:
                     key, paginate.get("page_size"), paginate.get("page")
                 )
 
-            cached_data = caches["default"].get(key)
-        except ConnectionError as error:
-            capture_exception(error)
-            cached_data = caches["fallback"].get(key)
+            if self.local:
+                cached_data = self.get_local(key)
+                if cached_data is not None:
+                    return cached_data
+
+            cached_data = self.codec.decode(call_cache("get", key))
+            stats["l2_hits" if cached_data is not None else "l2_misses"] += 1
+
+            if self.local and cached_data is not None:
+                self.set_local(key, cached_data)
         except CacheKeyWarning as error:
             print(error)
         except Exception as error:
@@ -125,12 +426,19 @@ class Cache:
         return cached_data
 
     def set(
-        self, key: str, data, paginate=None, store_keys=False, keys_key=None
+        self,
+        key: str,
+        data,
+        paginate=None,
+        store_keys=False,
+        keys_key=None,
+        timeout=None,
     ) -> None:
         # -- when data is set in the cache
         # it stores the key in list that's
         # related to the object saved
         # e.g cached_order_keys=[<all order related object keys>] --
+        timeout = self.timeout if timeout is None else timeout
         try:
             if keys_key is None:
                 keys_key = generate_keys_cache_key(self.prefix, key)
@@ -142,70 +450,164 @@ class Cache:
                     key, paginate.get("page_size"), paginate.get("page")
                 )
 
-            caches["default"].set(key, data, self.timeout)
+            call_cache("set", key, self.codec.encode(data), timeout)
+
+            # -- other processes drop their copy --
+            if self.local:
+                publish_invalidation(keys=[key])
+                self.set_local(key, data, timeout)
 
-        except ConnectionError as error:
-            capture_exception(error)
-            caches["fallback"].set(key, data, self.timeout)
         except CacheKeyWarning as error:
             print(error)
         except Exception as error:
             print(error)
 
-        # -- tries to store new keys to the list --
+        # -- tracks the key in the set of its family --
         if store_keys is True:
-            try:
-                keys = caches["default"].get(keys_key)
-            except ConnectionError as error:
-                capture_exception(error)
-                keys = caches["fallback"].get(keys_key)
-            except CacheKeyWarning as error:
-                print(error)
-            except Exception as error:
-                print(error)
+            self.track_key(keys_key, key, max(timeout or 0, self.timeout))
 
-            if keys is not None and len(keys) > 0:
-                tmp = keys.copy()  # copies keys from memory first
-                tmp.append(key)  # appends new key
-                tmp = list(set(tmp))
-
-                # print(tmp, "NEW KEYS")
-                try:
-                    caches["default"].delete(keys_key)  # delete old keys
-                    caches["default"].set(
-                        keys_key, tmp, self.timeout
-                    )  # replace with new keys
-                except ConnectionError as error:
-                    capture_exception(error)
-                    caches["fallback"].delete(keys_key)  # delete old keys
-                    caches["fallback"].set(
-                        keys_key, tmp, self.timeout
-                    )  # replace with new keys
-                except CacheKeyWarning as error:
-                    print(error)
-                except Exception as error:
-                    print(error)
-            else:
-                data = [key]
-
-                try:
-                    caches["default"].set(keys_key, data, self.timeout)
-                except ConnectionError as error:
-                    capture_exception(error)
-                    caches["fallback"].set(keys_key, data, self.timeout)
-                except CacheKeyWarning as error:
-                    print(error)
-                except Exception as error:
-                    print(error)
+    def track_key(self, keys_key, key, timeout):
+        """
+        Add a key to the set of keys of its family, with one
+        pipelined SADD and EXPIRE on redis
 
-    def invalidate(self, key):
+        Parameters
+        ----------
+            keys_key (str): Key of the family's set
+            key (str): Key to be tracked
+            timeout (int): Time in seconds for the set to expire
+        """
+        def add_to_set(client):
+            cache = caches["default"]
+            with client.pipeline(transaction=False) as pipe:
+                pipe.sadd(cache.make_key(keys_key), cache.make_key(key))
+                pipe.expire(cache.make_key(keys_key), timeout)
+                pipe.execute()
+
+        try:
+            call_redis(
+                add_to_set,
+                lambda cache: track_key_in_list(cache, keys_key, key, timeout),
+            )
+        except CacheKeyWarning as error:
+            print(error)
+        except Exception as error:
+            print(error)
+
+    def get_or_set(self, key, compute, paginate=None, store_keys=False, timeout=None):
+        """
+        Get the cached data for the given key or compute and cache it,
+        only one caller at a time computes a key
+
+        values are stored with the time they expire at and how long
+        they took to compute. A caller may recompute a value a little
+        before it expires, more likely the closer it gets and the
+        longer it takes to compute (probabilistic early expiration),
+        expired values are kept stale_ttl more seconds and served while
+        the caller holding the key's lock recomputes them. Without a
+        stale value the other callers wait up to LOCK_WAIT seconds for
+        the new one.
+
+        Parameters
+        ----------
+            key (str): Key to be used to get the cached data
+            compute (callable): returns the data when it isn't cached
+            paginate (dict): page and page_size of a paginated key
+            store_keys (bool): Track the key in its family, see set
+            timeout (int): Time in seconds for the data to expire
+
+        Example
+        -------
+            >>> cache = Cache(stale_ttl=60)
+            >>> cache.get_or_set('users', lambda: list_users())
+        """
+        timeout = self.timeout if timeout is None else timeout
+        entry = self.get(key, paginate)
+        if not isinstance(entry, dict) or "expires_at" not in entry:
+            entry = None
+
+        if entry is not None and not self.should_recompute(entry):
+            return entry["value"]
+
+        lock_key = self.get_lock_key(key, paginate)
+        token = generate_uuid()
+        if not self.acquire_lock(lock_key, token):
+            if entry is not None:
+                # -- someone else recomputes it --
+                return entry["value"]
+
+            entry = self.wait_for(key, paginate)
+            if entry is not None:
+                return entry["value"]
+
+        try:
+            started = time.monotonic()
+            value = compute()
+            entry = {
+                "value": value,
+                "expires_at": time.time() + timeout,
+                "delta": time.monotonic() - started,
+            }
+            self.set(
+                key,
+                entry,
+                paginate,
+                store_keys=store_keys,
+                timeout=timeout + self.stale_ttl,
+            )
+        finally:
+            self.release_lock(lock_key, token)
+
+        return value
+
+    def should_recompute(self, entry):
+        """True once the entry expired, or randomly a little before,
+        earlier for entries that take long to compute"""
+        jitter = 0
+        if self.beta:
+            jitter = -entry.get("delta", 0) * self.beta * math.log(random.random() or 1e-12)
+        return time.time() + jitter >= entry["expires_at"]
+
+    def get_lock_key(self, key, paginate=None):
         key = self._generate_cache_key(key)
+        if paginate is not None:
+            key = generate_pagination_cache_key(
+                key, paginate.get("page_size"), paginate.get("page")
+            )
+        return f"{key}_lock"
 
+    def acquire_lock(self, lock_key, token):
         try:
-            caches["default"].delete(key)
-        except ConnectionError as error:
+            return call_cache("add", lock_key, token, LOCK_TIMEOUT)
+        except Exception as error:
+            # -- without the lock everyone computes, like before --
             capture_exception(error)
-            caches["fallback"].delete(key)
+            return True
+
+    def release_lock(self, lock_key, token):
+        try:
+            if call_cache("get", lock_key) == token:
+                call_cache("delete", lock_key)
+        except Exception as error:
+            capture_exception(error)
+
+    def wait_for(self, key, paginate=None):
+        """waits for the caller holding the lock to cache the key,
+        None if it takes longer than LOCK_WAIT"""
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry = self.get(key, paginate)
+            if isinstance(entry, dict) and "expires_at" in entry:
+                return entry
+        return None
+
+    def invalidate(self, key):
+        key = self._generate_cache_key(key)
+
+        try:
+            call_cache("delete", key)
+            publish_invalidation(keys=[key])
         except CacheKeyWarning as error:
             print(error)
         except Exception as error:
@@ -214,9 +616,10 @@ class Cache:
     def get_many(self, keys):
         cache_keys = [self._generate_cache_key(key) for key in keys]
         try:
-            cached_data = caches["default"].get_many(cache_keys)
-        except ConnectionError:
-            cached_data = caches["fallback"].get_many(cache_keys)
+            cached_data = {
+                key: self.codec.decode(data)
+                for key, data in call_cache("get_many", cache_keys).items()
+            }
         except CacheKeyWarning as error:
             print(error)
         except Exception as error:
@@ -224,50 +627,62 @@ class Cache:
 
         return cached_data
 
-    def set_many(self, data_dict):
+    def set_many(self, data_dict, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
         cache_keys = {
-            self._generate_cache_key(key): data for key, data in data_dict.items()
+            self._generate_cache_key(key): self.codec.encode(data)
+            for key, data in data_dict.items()
         }
         try:
-            caches["default"].set_many(cache_keys, self.timeout)
-        except ConnectionError:
-            caches["default"].set_many(cache_keys, self.timeout)
+            call_cache("set_many", cache_keys, timeout)
         except CacheKeyWarning as error:
             print(error)
         except Exception as error:
             print(error)
 
     def invalidate_many(self, key: str | Any = None, keys=None, key_prefix=None):
-        keys_key = key
-        if key is None:
-            keys_key = generate_keys_cache_key(self.prefix, key_prefix)
+        """
+        Invalidate the given keys, or every key tracked
+        in a family with set(..., store_keys=True)
 
-        if keys is None:
-            # -- get keys from cache
-            # should be a list of keys --
+        Parameters
+        ----------
+            key (str): Family to invalidate, e.g. "users"
+            keys (list): Keys to delete instead of a family
+            key_prefix (str): Family to invalidate, when key isn't given
+
+        Example
+        -------
+            >>> cache = Cache()
+            >>> cache.set("users", data, paginate, store_keys=True)
+            >>> cache.invalidate_many("users")
+        """
+        if keys is not None:
             try:
-                keys = caches["default"].get(keys_key)
-            except ConnectionError as error:
-                capture_exception(error)
-                keys = caches["fallback"].get(keys_key)
+                call_cache("delete_many", keys)
+                publish_invalidation(keys=list(keys))
             except CacheKeyWarning as error:
                 print(error)
             except Exception as error:
                 print(error)
+            return
 
-        if keys is None:
-            # -- set to empty list --
-            keys = []
-
-            print("couldn't find keys to delete, nothing would be deleted")
+        family = key if key is not None else key_prefix
+        keys_key = generate_keys_cache_key(self.prefix, family)
 
-        # -- delete objects --
+        # -- the keys are deleted on the server
+        # with the set in one atomic call --
         try:
-            caches["default"].delete_many(keys)
-            caches["default"].delete("paginated_shipments")
-        except ConnectionError:
-            caches["fallback"].delete_many(keys)
-            caches["fallback"].delete("paginated_shipments")
+            call_redis(
+                lambda client: client.eval(
+                    INVALIDATE_FAMILY_SCRIPT, 1, caches["default"].make_key(keys_key)
+                ),
+                lambda cache: invalidate_list(cache, keys_key),
+                missed={"families": [keys_key]},
+            )
+            # -- the family's keys all start with
+            # the prefixed family name --
+            publish_invalidation(prefixes=[self._generate_cache_key(family)])
         except CacheKeyWarning as error:
             print(error)
         except Exception as error:
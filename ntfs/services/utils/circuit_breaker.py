@@ -0,0 +1,133 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker with a background health probe
+
+    the breaker is closed while calls succeed, after threshold
+    consecutive failures it opens: callers skip the failing service
+    (allow returns False) and a thread calls probe every
+    probe_interval seconds until it succeeds, which closes it again.
+
+    on_close catches the service up with what it missed while open,
+    it runs before the breaker closes (an error keeps it open) and
+    once after, for the calls that raced with closing.
+
+    Attributes
+    ----------
+        threshold (int): consecutive failures that open the breaker
+        probe_interval (int): time in seconds between probes
+        probe (callable): raises while the service is down
+        on_close (callable): called when the probe succeeds
+
+    Example
+    -------
+        >>> breaker = CircuitBreaker(threshold=3, probe=client.ping)
+        >>> if breaker.allow():
+        ...     try:
+        ...         client.get('key')
+        ...     except ConnectionError:
+        ...         breaker.record_failure()
+        ...     else:
+        ...         breaker.record_success()
+
+    Methods
+    -------
+        allow: Whether the service should be called
+        record_success: Reset the consecutive failures
+        record_failure: Count a failure, opens the breaker past threshold
+        snapshot: State and counters of the breaker
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+
+    def __init__(self, threshold=3, probe_interval=5, probe=None, on_close=None):
+        self.threshold = threshold
+        self.probe_interval = probe_interval
+        self.probe = probe
+        self.on_close = on_close
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.counters = {"opened": 0, "closed": 0, "short_circuited": 0}
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self._pid = None
+
+    def allow(self):
+        if self.state == self.CLOSED:
+            return True
+
+        with self._lock:
+            self.counters["short_circuited"] += 1
+            # -- the probe thread doesn't survive a fork --
+            self.start_probe()
+        return False
+
+    def record_success(self):
+        if self.failures:
+            with self._lock:
+                self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.CLOSED and self.failures >= self.threshold:
+                logger.warning(f"circuit opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.time()
+                self.counters["opened"] += 1
+                self.start_probe()
+
+    def close(self):
+        with self._lock:
+            logger.info("circuit closed, probe succeeded")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self.counters["closed"] += 1
+
+    def start_probe(self):
+        if self.probe is None:
+            return
+        if self._pid == os.getpid() and self._probe_thread.is_alive():
+            return
+
+        self._pid = os.getpid()
+        self._probe_thread = threading.Thread(
+            target=self.run_probe, name="circuit-breaker-probe", daemon=True
+        )
+        self._probe_thread.start()
+
+    def run_probe(self):
+        while self.state == self.OPEN:
+            time.sleep(self.probe_interval)
+            try:
+                self.probe()
+                if self.on_close is not None:
+                    self.on_close()
+            except Exception as error:
+                logger.debug(f"circuit probe failed: {error}")
+                continue
+            self.close()
+
+            if self.on_close is not None:
+                try:
+                    self.on_close()
+                except Exception as error:
+                    logger.warning(f"circuit close hook failed: {error}")
+
+    def snapshot(self):
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened_at": self.opened_at,
+            **self.counters,
+        }
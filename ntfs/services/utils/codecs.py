@@ -0,0 +1,245 @@
+"""codecs for values stored by services.utils.Cache
+
+by default values go to the cache as they are and django pickles
+them. A Cache created with ``codec=<name>`` encodes values with one of
+the CACHE_CODECS from settings first:
+
+    CACHE_CODECS = {
+        "compact": {"SERIALIZER": "json", "COMPRESSION": "zlib", "THRESHOLD": 1024},
+    }
+
+SERIALIZER is msgpack or json (orjson when installed), values encoded
+to more than THRESHOLD bytes are compressed with COMPRESSION: zstd,
+lz4 or zlib. zstandard, lz4 and orjson are optional dependencies,
+only needed by the codecs that use them, a codec that can't be built
+falls back to pickle with a warning.
+
+encoded values start with a 4 byte header (magic, serializer and
+compression ids), values without it are returned as they are, so
+switching a Cache to a codec doesn't break values cached before.
+"""
+import json
+import logging
+import zlib
+from functools import lru_cache
+
+import msgpack
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"NC"
+UNCOMPRESSED = 0
+
+
+class MsgpackSerializer:
+    id = 1
+
+    def dumps(self, value):
+        # -- uuids, dates and decimals become strings,
+        # like in a DRF response --
+        return msgpack.packb(value, default=str)
+
+    def loads(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class JSONSerializer:
+    id = 2
+
+    def dumps(self, value):
+        if orjson is not None:
+            return orjson.dumps(value, default=str)
+        return json.dumps(value, default=str, separators=(",", ":")).encode()
+
+    def loads(self, data):
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class ZstdCompressor:
+    id = 1
+
+    def __init__(self, level=3):
+        if zstandard is None:
+            raise ImproperlyConfigured("zstd compression requires zstandard")
+        self.compressor = zstandard.ZstdCompressor(level=level)
+        self.decompressor = zstandard.ZstdDecompressor()
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def decompress(self, data):
+        return self.decompressor.decompress(data)
+
+
+class LZ4Compressor:
+    id = 2
+
+    def __init__(self, level=0):
+        if lz4 is None:
+            raise ImproperlyConfigured("lz4 compression requires lz4")
+        self.level = level
+
+    def compress(self, data):
+        return lz4.frame.compress(data, compression_level=self.level)
+
+    def decompress(self, data):
+        return lz4.frame.decompress(data)
+
+
+class ZlibCompressor:
+    id = 3
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data):
+        return zlib.decompress(data)
+
+
+SERIALIZERS = {"msgpack": MsgpackSerializer, "json": JSONSerializer}
+COMPRESSORS = {"zstd": ZstdCompressor, "lz4": LZ4Compressor, "zlib": ZlibCompressor}
+
+
+class PassthroughCodec:
+    """leaves values to the cache backend's serializer (pickle)"""
+
+    name = "pickle"
+
+    def encode(self, value):
+        return value
+
+    def decode(self, value):
+        return value
+
+
+class Codec:
+    """
+    Serializes values and compresses the large ones
+
+    Attributes
+    ----------
+        serializer (str): msgpack or json
+        compression (str): zstd, lz4, zlib or None
+        threshold (int): values encoded to more bytes are compressed
+        level (int): compression level, the compressor's default if None
+
+    Example
+    -------
+        >>> codec = Codec("msgpack", compression="zlib", threshold=16)
+        >>> codec.decode(codec.encode({"users": ["a"] * 10}))
+        {'users': ['a', 'a', 'a', 'a', 'a', 'a', 'a', 'a', 'a', 'a']}
+
+    Methods
+    -------
+        encode: Encode a value to bytes
+        decode: Decode bytes from encode, other values are returned as is
+    """
+
+    def __init__(self, serializer="msgpack", compression=None, threshold=1024, level=None):
+        if serializer not in SERIALIZERS:
+            raise ImproperlyConfigured(
+                f"cache serializer must be one of {', '.join(SERIALIZERS)}"
+            )
+        if compression is not None and compression not in COMPRESSORS:
+            raise ImproperlyConfigured(
+                f"cache compression must be one of {', '.join(COMPRESSORS)}"
+            )
+
+        self.name = f"{serializer}+{compression}" if compression else serializer
+        self.serializer = SERIALIZERS[serializer]()
+        self.threshold = threshold
+        self.compressor = None
+        if compression is not None:
+            compressor = COMPRESSORS[compression]
+            self.compressor = compressor() if level is None else compressor(level)
+
+        self.decompressors = {}
+
+    def get_decompressor(self, compression_id):
+        # -- values may have been written with another compression --
+        if self.compressor is not None and compression_id == self.compressor.id:
+            return self.compressor
+
+        if compression_id not in self.decompressors:
+            compressor = next(
+                compressor
+                for compressor in COMPRESSORS.values()
+                if compressor.id == compression_id
+            )
+            self.decompressors[compression_id] = compressor()
+        return self.decompressors[compression_id]
+
+    def encode(self, value):
+        data = self.serializer.dumps(value)
+        compression_id = UNCOMPRESSED
+        if self.compressor is not None and len(data) > self.threshold:
+            data = self.compressor.compress(data)
+            compression_id = self.compressor.id
+        return MAGIC + bytes((self.serializer.id, compression_id)) + data
+
+    def decode(self, value):
+        if not isinstance(value, bytes) or not value.startswith(MAGIC):
+            return value
+
+        serializer_id, compression_id, data = value[2], value[3], value[4:]
+        if compression_id != UNCOMPRESSED:
+            data = self.get_decompressor(compression_id).decompress(data)
+
+        if serializer_id == self.serializer.id:
+            return self.serializer.loads(data)
+        serializer = next(
+            serializer for serializer in SERIALIZERS.values() if serializer.id == serializer_id
+        )
+        return serializer().loads(data)
+
+
+PASSTHROUGH = PassthroughCodec()
+
+
+@lru_cache(maxsize=None)
+def get_codec(name=None):
+    """returns the CACHE_CODECS codec called name, the passthrough
+    codec for None, pickle or a codec that can't be built"""
+    if name in (None, "pickle"):
+        return PASSTHROUGH
+
+    codecs = getattr(settings, "CACHE_CODECS", {})
+    if name not in codecs:
+        logger.warning(f"cache codec {name} isn't in CACHE_CODECS, using pickle")
+        return PASSTHROUGH
+
+    options = codecs[name]
+    try:
+        return Codec(
+            serializer=options.get("SERIALIZER", "msgpack"),
+            compression=options.get("COMPRESSION"),
+            threshold=options.get("THRESHOLD", 1024),
+            level=options.get("LEVEL"),
+        )
+    except ImproperlyConfigured as error:
+        # -- e.g. zstandard isn't installed, values are still
+        # cached, only not compressed --
+        logger.warning(f"cache codec {name} unavailable, using pickle: {error}")
+        return PASSTHROUGH
@@ -0,0 +1,137 @@
+"""coherence of in-process caches across processes
+
+every process holding an in-process (L1) cache subscribes to a redis
+pub/sub channel. A process that changes or deletes cached keys drops
+them from its own L1 and publishes them, the other processes drop them
+from theirs. Messages carry the id of the process that sent them so it
+ignores its own.
+
+pub/sub delivery is at-most-once, an L1 must only be read while the
+subscription is up, it's cleared whenever the subscription is
+(re)established since messages may have been missed in between.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_DELAY = 1
+# -- seconds the subscriber waits for a message before
+# pinging the server to check the connection --
+HEALTH_CHECK_INTERVAL = 30
+
+
+class Invalidator:
+    """
+    Publishes and applies invalidations of an in-process cache
+
+    Attributes
+    ----------
+        local (LRUCache): the in-process cache kept coherent
+        get_client (callable): returns the redis client, None when
+            the shared cache isn't redis
+        channel (str): the pub/sub channel
+        get_subscriber (callable): returns the redis client of the
+            subscription, get_client if None
+
+    Methods
+    -------
+        start: Start the subscriber thread of this process
+        is_connected: Whether the local cache can be read
+        publish: Invalidate keys here and in every other process
+    """
+
+    def __init__(self, local, get_client, channel, get_subscriber=None):
+        self.local = local
+        self.get_client = get_client
+        self.get_subscriber = get_subscriber or get_client
+        self.channel = channel
+        self.sender_id = uuid.uuid4().hex
+        self._connected = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.disabled = False
+
+    def start(self):
+        # -- threads don't survive a fork, prefork pool
+        # processes each start their own --
+        if self.disabled or (self._pid == os.getpid() and self._thread.is_alive()):
+            return
+
+        with self._lock:
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                # -- a forked child would ignore the messages
+                # of its parent and siblings --
+                if self._pid not in (None, os.getpid()):
+                    self.sender_id = uuid.uuid4().hex
+                self._pid = os.getpid()
+                self._connected.clear()
+                self.local.clear()
+                self._thread = threading.Thread(
+                    target=self.run, name="cache-invalidator", daemon=True
+                )
+                self._thread.start()
+
+    def is_connected(self):
+        return self._pid == os.getpid() and self._connected.is_set()
+
+    def run(self):
+        while True:
+            try:
+                client = self.get_subscriber()
+                if client is None:
+                    logger.warning("shared cache isn't redis, in-process cache disabled")
+                    self.disabled = True
+                    return
+                self.listen(client)
+            except Exception as error:
+                logger.warning(f"cache invalidation subscription lost: {error}")
+            finally:
+                self._connected.clear()
+                self.local.clear()
+            time.sleep(RECONNECT_DELAY)
+
+    def listen(self, client):
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        try:
+            pubsub.subscribe(self.channel)
+            # -- anything cached before now may have missed a message --
+            self.local.clear()
+            self._connected.set()
+            while True:
+                # -- None while idle, the health check
+                # pings the server between waits --
+                message = pubsub.get_message(timeout=HEALTH_CHECK_INTERVAL)
+                if message is not None:
+                    self.handle(message["data"])
+        finally:
+            pubsub.close()
+
+    def handle(self, data):
+        message = json.loads(data)
+        if message.get("sender") == self.sender_id:
+            return
+        self.apply(message.get("keys", ()), message.get("prefixes", ()))
+
+    def apply(self, keys=(), prefixes=()):
+        self.local.delete(*keys)
+        for prefix in prefixes:
+            self.local.delete_prefix(prefix)
+
+    def publish(self, keys=(), prefixes=()):
+        """drops keys (and keys starting with prefixes) from the local
+        cache and from the local cache of every other process"""
+        self.apply(keys, prefixes)
+        client = self.get_client()
+        if client is not None:
+            client.publish(
+                self.channel,
+                json.dumps(
+                    {"sender": self.sender_id, "keys": list(keys), "prefixes": list(prefixes)}
+                ),
+            )
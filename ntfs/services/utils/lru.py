@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Bounded in-process LRU cache with a TTL per entry
+
+    Attributes
+    ----------
+        maxsize (int): max number of entries, the least recently
+            used entry is evicted past it
+        ttl (int): default time in seconds for an entry to expire
+
+    Example
+    -------
+        >>> lru = LRUCache(maxsize=2, ttl=60)
+        >>> lru.set('key', 'value')
+        >>> lru.get('key')
+        'value'
+
+    Methods
+    -------
+        get: Get the entry for the given key, None if missing or expired
+        set: Set the entry for the given key
+        delete: Delete the entries for the given keys
+        delete_prefix: Delete the entries whose key starts with a prefix
+        clear: Delete every entry
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._data if key.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()